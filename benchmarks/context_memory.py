@@ -0,0 +1,55 @@
+"""
+Memory of the per-chat context window.
+
+Feeds messages from an increasing number of active chats into ChatContext and reports the
+memory it holds (tracemalloc), the bytes per remembered message and the cost of record()
+and window(). Past max_chats the held memory must stay flat: the least recently active
+chats are evicted.
+
+    python -m benchmarks.context_memory --chats 1000 10000 50000 100000 --max-chats 20000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from services.context import ChatContext
+from tools.fake_telegram import SAMPLE_TEXTS
+
+
+def measure(chats: int, args: argparse.Namespace) -> None:
+    context = ChatContext(size=args.size, max_chats=args.max_chats, max_text=args.max_text)
+    messages = chats * args.size
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for message_id in range(messages):
+        chat_id = -1000 - message_id // args.size  # every chat fills its ring, then the next one starts
+        # A fresh string per message, as with real updates.
+        context.record(chat_id, message_id, random.randrange(100, 100_000), f"{random.choice(SAMPLE_TEXTS)} {message_id}")
+    record_us = (time.perf_counter() - start) / messages * 1e6
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    remembered = min(chats, args.max_chats)
+    start = time.perf_counter()
+    for _ in range(10_000):
+        context.window(-1000 - random.randrange(chats - remembered, chats), args.tokens)
+    window_us = (time.perf_counter() - start) / 10_000 * 1e6
+
+    print(f"chats={chats:>7,}  remembered={len(context):>7,}  held_mb={held / 2 ** 20:7.1f}  "
+          f"bytes_per_message={held / (len(context) * args.size):6.1f}  "
+          f"record_us={record_us:5.2f}  window_us={window_us:5.1f}  evictions={context.evictions:,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1_000, 10_000, 50_000, 100_000])
+    parser.add_argument("--max-chats", type=int, default=20_000)
+    parser.add_argument("--size", type=int, default=10, help="messages per chat")
+    parser.add_argument("--max-text", type=int, default=300)
+    parser.add_argument("--tokens", type=int, default=300, help="token budget of window()")
+    args = parser.parse_args()
+    for chats in args.chats:
+        measure(chats, args)
@@ -0,0 +1,152 @@
+"""
+Event-loop lag of FirebaseClient backends.
+
+Runs a burst of concurrent reads/updates against a fake Realtime DB with a fixed
+round-trip latency while a ticker task measures how late the loop wakes it up.
+
+    python -m benchmarks.firebase_loop_lag --ops 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from aiohttp import web
+
+from services.firebase import FirebaseClient, FirebaseBackend
+
+
+class FakeReference:
+    _lock = threading.Lock()
+
+    def __init__(self, store: dict, path: str, latency: float) -> None:
+        self.store = store
+        self.path = path
+        self.latency = latency
+
+    def get(self, shallow: bool = False):
+        time.sleep(self.latency)
+        value = self.store.get(self.path)
+        if shallow and isinstance(value, dict):
+            return {key: True for key in value}
+        return value
+
+    def set(self, value):
+        time.sleep(self.latency)
+        self.store[self.path] = value
+
+    def update(self, value):
+        time.sleep(self.latency)
+        self.store.setdefault(self.path, {}).update(value)
+
+    def delete(self):
+        time.sleep(self.latency)
+        self.store.pop(self.path, None)
+
+    def transaction(self, function):
+        """Optimistic like firebase_admin: read, compute, write only if the value is still the one read."""
+        while True:
+            current = self.store.get(self.path)
+            value = function(current)
+            time.sleep(self.latency)
+            with self._lock:
+                if self.store.get(self.path) == current:
+                    self.store[self.path] = value
+                    return value
+
+
+class FakeDb:
+    """Stands in for firebase_admin.db: every call blocks for `latency` seconds."""
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.store = {}
+
+    def reference(self, path: str = "/") -> FakeReference:
+        return FakeReference(self.store, path, self.latency)
+
+
+class BenchFirebaseClient(FirebaseClient):
+    def __init__(self, backend: FirebaseBackend, latency: float, url: str = "http://127.0.0.1") -> None:
+        self.latency = latency
+        super().__init__(firebase_url=url, secret="", backend=backend)
+
+    def _connect(self):
+        return FakeDb(self.latency)
+
+    async def _access_token(self) -> str:
+        return "bench"
+
+
+async def fake_rest_server(latency: float) -> tuple[web.AppRunner, str]:
+    store = {}
+
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        path = request.match_info["path"]
+        if request.method in ("PUT", "PATCH"):
+            store[path] = await request.json()
+        elif request.method == "DELETE":
+            store.pop(path, None)
+        return web.json_response(store.get(path))
+
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}.json", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def measure(client: FirebaseClient, ops: int, interval: float = 0.005) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def op(i: int) -> None:
+        if i % 2:
+            await client.read(f"moderation/1/{i}")
+        else:
+            await client.update(f"moderation/1/{i}", {"strikes": 1})
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(op(i) for i in range(ops)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    await client.close()
+
+    lags.sort()
+    return {
+        "elapsed_s": elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if len(lags) > 1 else lags[-1] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+async def main(ops: int, latency: float) -> None:
+    runner, url = await fake_rest_server(latency)
+    try:
+        for backend in FirebaseBackend:
+            client = BenchFirebaseClient(backend, latency, url)
+            result = await measure(client, ops)
+            print(f"{backend.value:<9} " + "  ".join(f"{k}={v:.2f}" for k, v in result.items()))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated round trip, seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.ops, args.latency))
@@ -0,0 +1,102 @@
+"""
+Time to decision of LLM verdicts, full completions vs streaming with early termination.
+
+A fake model answers after a time to first token and then one token per --token-ms; safe answers
+often go on with an explanation (--chatter tokens), unsafe ones give a reason of --reason tokens.
+Every message is validated through LLMService both ways and the percentiles of the time until the
+verdict is known are reported per outcome, with the tokens the model had to generate.
+
+    python -m benchmarks.llm_streaming --messages 500 --unsafe 0.1 --ttft-ms 300 --token-ms 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks.replay import percentile
+from services import ConsoleLog, LLMService
+from services.llm import MESSAGE_HEADER
+
+
+class FakeStreamingCompletions:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.tokens = 0
+        self.cut = 0
+
+    def answer(self, prompt: str) -> list[str]:
+        if "spam" in prompt:
+            return ["unsafe", " Спам"] + [" реклама"] * (self.args.reason - 1)
+        return ["safe"] + [" –", " сообщение"] * (self.args.chatter // 2)
+
+    async def create(self, model: str, messages: list[dict], stream: bool = False, max_tokens: int | None = None,
+                     **kwargs):
+        tokens = self.answer(messages[-1]["content"].rpartition(MESSAGE_HEADER)[2])[:max_tokens]
+        if stream:
+            return self._chunks(tokens)
+        await asyncio.sleep((self.args.ttft_ms + len(tokens) * self.args.token_ms) / 1000)
+        self.tokens += len(tokens)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))])
+
+    async def _chunks(self, tokens: list[str]):
+        await asyncio.sleep(self.args.ttft_ms / 1000)
+        sent = 0
+        try:
+            for token in tokens:
+                if sent:
+                    await asyncio.sleep(self.args.token_ms / 1000)
+                sent += 1
+                self.tokens += 1
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+        finally:
+            self.cut += sent < len(tokens)
+
+
+async def measure(stream: bool, texts: list[str], args: argparse.Namespace, console_log: ConsoleLog) -> None:
+    os.environ.setdefault("LLM_API_KEY", "bench")
+    llm_service = LLMService(console_log, lazy=True, stream=stream, reason_tokens=args.reason_tokens)
+    completions = FakeStreamingCompletions(args)
+    llm_service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    decisions: dict[str, list[float]] = {"safe": [], "unsafe": []}
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def validate(text: str) -> None:
+        async with slots:
+            start = time.perf_counter()
+            status, _ = await llm_service.validate_message(text)
+            decisions[status].append(time.perf_counter() - start)
+
+    await asyncio.gather(*(validate(text) for text in texts))
+    everything = decisions["safe"] + decisions["unsafe"]
+    for outcome, values in (("all", everything), *decisions.items()):
+        print(f"{'stream' if stream else 'full':<6}  {outcome:<6}  n={len(values):>5}  "
+              f"decision_p50_ms={percentile(values, 0.50) * 1000:7.1f}  "
+              f"decision_p90_ms={percentile(values, 0.90) * 1000:7.1f}  "
+              f"decision_p99_ms={percentile(values, 0.99) * 1000:7.1f}")
+    print(f"{'stream' if stream else 'full':<6}  tokens_generated={completions.tokens}  "
+          f"streams_cut={completions.cut}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    console_log = ConsoleLog("%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING)
+    random.seed(args.seed)
+    texts = [f"message {i} {'spam' if random.random() < args.unsafe else 'hello'}" for i in range(args.messages)]
+    for stream in (False, True):
+        await measure(stream, texts, args, console_log)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--unsafe", type=float, default=0.1, help="share of unsafe messages")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="time to the first token")
+    parser.add_argument("--token-ms", type=float, default=20, help="time per next token")
+    parser.add_argument("--chatter", type=int, default=20, help="tokens a safe answer goes on with")
+    parser.add_argument("--reason", type=int, default=30, help="tokens of the reason of an unsafe answer")
+    parser.add_argument("--reason-tokens", type=int, default=64, help="max_tokens of streamed answers")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,352 @@
+"""
+End-to-end replay of update streams through the real Bot.handlers().
+
+Telegram, the LLM and Firebase are replaced by in-process fakes with configurable
+latency and error injection; everything between them (handlers, prefilter, flood
+index, caches, moderation store, outbound scheduler) is the production code.
+Reports throughput, per-update latency, event-loop lag and memory for each scenario. Outbound
+calls are not throttled by default, to measure the bot itself; telegram_drain_s is how long the
+calls it made would take to leave under the production rate limits.
+
+    python -m benchmarks.replay --scenario all --updates 2000 --llm-latency 0.3
+    python -m benchmarks.replay --input updates.jsonl    # recorded updates, one JSON per line
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from firebase_admin.exceptions import FirebaseError
+from telegram import Update
+from telegram.error import NetworkError
+from telegram.ext import Application, ExtBot
+
+from benchmarks.firebase_loop_lag import FakeDb
+from bot import Bot, ChatOrderedUpdateProcessor, ConcurrencyLimiter
+from bot.lifecycle import running
+from services import LLMService, ConsoleLog, BufferedFirebaseLog, FirebaseClient, ModerationStore, VerdictCache, \
+    PreFilter, FloodIndex, ActionScheduler, VerifiedUsers, TimerScheduler, \
+    ChatContext, metrics
+from services.llm import BATCH_PROMPT, MESSAGE_HEADER
+from tools.fake_telegram import SAMPLE_TEXTS, message_update, new_members_update, private_message_update, user
+
+BOT_ID = 42
+ADMIN_ID = 1
+SPAM_MARKERS = ("заработ", "казино", "пиши в лс")
+
+
+class FakeTelegramBot(ExtBot):
+    """ExtBot answering every Bot API call locally after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        super().__init__(token="1:bench")
+        with self._unfrozen():
+            self.latency = latency
+            self.error_rate = error_rate
+            self.calls: dict[str, int] = {}
+            self.log: list[tuple[float, object, str]] = []
+            self._message_ids = iter(range(10 ** 9, 2 * 10 ** 9))
+
+    async def _do_post(self, endpoint: str, data: dict, **kwargs) -> bool | dict | list[dict]:
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        self.log.append((time.perf_counter(), data.get("chat_id"), endpoint))
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if endpoint != "getMe" and random.random() < self.error_rate:
+            raise NetworkError("injected Telegram failure")
+        match endpoint:
+            case "getMe":
+                return {**user(BOT_ID), "is_bot": True, "username": "bench_bot"}
+            case "getChatAdministrators":
+                return [{"status": "creator", "user": user(ADMIN_ID), "is_anonymous": False}]
+            case "sendMessage":
+                return {"message_id": next(self._message_ids), "date": int(time.time()),
+                        "chat": {"id": int(data["chat_id"]), "type": "supergroup"}, "text": data.get("text", "")}
+            case _:
+                return True
+
+
+class FakeCompletions:
+    """Stands in for AsyncTogether.chat.completions: flags messages containing SPAM_MARKERS."""
+
+    def __init__(self, latency: float, error_rate: float) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+
+    async def create(self, model: str, messages: list[dict], **kwargs) -> SimpleNamespace:
+        self.requests += 1
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            raise TimeoutError("injected LLM failure")
+        system, prompt = messages[0]["content"], messages[-1]["content"]
+        if system.endswith(BATCH_PROMPT):
+            lines = [line for line in prompt.splitlines() if line.startswith("[")]  # context lines start with ">"
+            content = "\n".join(f"{i} {self.verdict(line)}" for i, line in enumerate(lines, 1))
+        else:
+            content = self.verdict(prompt.rpartition(MESSAGE_HEADER)[2])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    @staticmethod
+    def verdict(text: str) -> str:
+        text = text.casefold()
+        return "unsafe Спам" if any(marker in text for marker in SPAM_MARKERS) else "safe"
+
+
+class FakeLLMService(LLMService):
+    def __init__(self, console_log: ConsoleLog, latency: float, error_rate: float, **kwargs) -> None:
+        os.environ.setdefault("LLM_API_KEY", "bench")
+        super().__init__(console_log, **kwargs)
+        self.completions = FakeCompletions(latency, error_rate)
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+
+
+class FakeFirebase:
+    """Mixin replacing firebase_admin with FakeDb; errors are injected before the blocking call."""
+    latency = 0.0
+    error_rate = 0.0
+    store = None
+
+    def _connect(self):
+        fake = FakeDb(self.latency)
+        if self.store is not None:
+            fake.store = self.store
+        return fake
+
+    async def _access_token(self) -> str:
+        return "bench"
+
+    def _admin_request(self, method: str, path: str, data: object = None, shallow: bool = False,
+                       query: dict | None = None) -> object:
+        if random.random() < self.error_rate:
+            raise FirebaseError("UNAVAILABLE", "injected Firebase failure")
+        return super()._admin_request(method, path, data, shallow, query)
+
+
+class FakeFirebaseClient(FakeFirebase, FirebaseClient):
+    def __init__(self, latency: float, error_rate: float, store: dict) -> None:
+        self.latency, self.error_rate, self.store = latency, error_rate, store
+        super().__init__(firebase_url="http://127.0.0.1", secret="")
+
+
+class FakeFirebaseLog(FakeFirebase, BufferedFirebaseLog):
+    def __init__(self, latency: float, error_rate: float, store: dict) -> None:
+        self.latency, self.error_rate, self.store = latency, error_rate, store
+        super().__init__(firebase_url="http://127.0.0.1", secret="")
+
+
+def chat_traffic(updates: int, chats: int = 50, users: int = 5000) -> list[dict]:
+    """Ordinary group traffic: many chats, the sample mix of benign and spam texts."""
+    return [message_update(-1000 - random.randrange(chats), random.randrange(100, users), random.choice(SAMPLE_TEXTS))
+            for _ in range(updates)]
+
+
+def raid(updates: int, chat_id: int = -1000) -> list[dict]:
+    """Accounts join one chat in waves and post variations of the same spam text."""
+    stream = []
+    next_user = 10_000
+    spam = "Заработай {} рублей в день без вложений, пиши в лс @raid_{}"
+    while len(stream) < updates:
+        wave = list(range(next_user, next_user + 20))
+        next_user += len(wave)
+        stream.append(new_members_update(chat_id, wave))
+        stream.extend(message_update(chat_id, user_id, spam.format(random.randrange(1000, 9999), user_id))
+                      for user_id in wave)
+    return stream[:updates]
+
+
+def appeals(updates: int, store: dict, chats: int = 20) -> list[dict]:
+    """Restricted users write to the bot privately to be let back into their chats."""
+    stream = []
+    for user_id in range(20_000, 20_000 + updates):
+        store[f"users_unavailable_chats/{user_id}"] = {
+            str(chat_id): user_id for chat_id in random.sample(range(-1000 - chats, -1000), 3)}
+        stream.append(private_message_update(user_id))
+    return stream
+
+
+def admin_storm(updates: int, chats: int = 10) -> list[dict]:
+    """Admins answering offending messages with moderation commands."""
+    commands = ["/mute спам", "/dmute спам", "/tmute спам 1h", "/unmute", "/ban спам", "/sban спам", "/unban",
+                "/kick", "/strike", "/rstrike", "/blockword казино", "/stats"]
+    stream = []
+    for _ in range(updates):
+        chat_id = -1000 - random.randrange(chats)
+        target = message_update(chat_id, random.randrange(100, 5000), random.choice(SAMPLE_TEXTS))["message"]
+        stream.append(message_update(chat_id, ADMIN_ID, random.choice(commands), reply_to=target))
+    return stream
+
+
+def recorded(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def telegram_drain(log: list[tuple[float, object, str]], start: float, args: argparse.Namespace) -> float:
+    """
+    Seconds from start until the last of the logged calls would have been sent under the production
+    limits: the ActionScheduler buckets (global for every call, per chat for messages only), in the
+    order the calls were made, as a generic cell rate algorithm on virtual time.
+    """
+    global_due, chats = float("-inf"), {}
+    last = start
+    for called, chat_id, endpoint in log:
+        send = called
+        if endpoint.startswith(("send", "forward", "copy")):
+            due = chats.get(chat_id, float("-inf"))
+            send = max(send, due - (args.telegram_chat_burst - 1) / args.telegram_chat_rate)
+            chats[chat_id] = max(due, send) + 1 / args.telegram_chat_rate
+        send = max(send, global_due - (args.telegram_global_rate - 1) / args.telegram_global_rate)
+        global_due = max(global_due, send) + 1 / args.telegram_global_rate
+        last = max(last, send)
+    return last - start
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def replay(stream: list[dict], args: argparse.Namespace, store: dict) -> dict:
+    console_log = ConsoleLog("%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                             level=getattr(logging, args.log_level))
+    firebase_client = FakeFirebaseClient(args.firebase_latency, args.firebase_errors, store)
+    firebase_log = FakeFirebaseLog(args.firebase_latency, args.firebase_errors, store)
+    moderation_store = ModerationStore(firebase_client=firebase_client)
+    verdict_cache = VerdictCache()
+    llm_service = FakeLLMService(console_log, args.llm_latency, args.llm_errors, verdict_cache=verdict_cache,
+                                 batch_size=args.llm_batch)
+    prefilter = PreFilter()
+    action_scheduler = ActionScheduler(global_rate=args.telegram_rate, chat_rate=args.telegram_rate,
+                                       chat_burst=int(args.telegram_rate))
+    telegram = FakeTelegramBot(args.telegram_latency, args.telegram_errors)
+
+    timers = TimerScheduler()
+
+    app = Application.builder().bot(telegram) \
+        .concurrent_updates(ChatOrderedUpdateProcessor(max_concurrent_updates=args.concurrency)).build()
+    bot = Bot(llm_service=llm_service, firebase_client=firebase_client, firebase_log=firebase_log,
+              console_log=console_log, moderation_store=moderation_store, prefilter=prefilter,
+              llm_limiter=ConcurrencyLimiter(), flood_index=FloodIndex(), action_scheduler=action_scheduler,
+              verified_users=VerifiedUsers(), timers=timers, chat_context=ChatContext())
+    app.add_error_handler(bot.error_handler)
+    for handler in bot.handlers():
+        app.add_handler(handler)
+
+    latencies = []
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker(interval: float = 0.005) -> None:
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def feed(data: dict) -> None:
+        start = time.perf_counter()
+        update = Update.de_json(data, telegram)
+        await app.update_processor.process_update(update, app.process_update(update))
+        latencies.append(time.perf_counter() - start)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    async with running(app):
+        moderation_store.start()
+        bot.expiry.start(telegram)
+        timers.start()
+        tick = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        tasks = []
+        for data in stream:
+            tasks.append(asyncio.create_task(feed(data)))
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        done.set()
+        await tick
+        await timers.close()
+        await bot.auth.close()
+        await action_scheduler.close()
+        await moderation_store.close()
+        await firebase_log.close()
+        await firebase_client.close()
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else 0
+    tracemalloc.stop()
+
+    result = {
+        "updates": len(stream),
+        "throughput_ups": len(stream) / elapsed,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "lag_p50_ms": (statistics.median(lags) if lags else 0) * 1000,
+        "lag_max_ms": max(lags, default=0) * 1000,
+        "llm_requests": llm_service.completions.requests,
+        "telegram_calls": sum(telegram.calls.values()),
+        "telegram_drain_s": telegram_drain(telegram.log, start, args),
+        "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.tracemalloc:
+        result["traced_peak_mb"] = traced_peak / 2 ** 20
+    return result
+
+
+SCENARIOS = ["chat", "raid", "appeals", "admin"]
+
+
+async def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    if args.metrics:
+        metrics.enable()
+    if args.input:
+        runs = [("recorded", lambda store: recorded(args.input))]
+    else:
+        generators = {
+            "chat": lambda store: chat_traffic(args.updates),
+            "raid": lambda store: raid(args.updates),
+            "appeals": lambda store: appeals(args.updates, store),
+            "admin": lambda store: admin_storm(args.updates),
+        }
+        runs = [(name, generators[name]) for name in (SCENARIOS if args.scenario == "all" else [args.scenario])]
+    for name, generate in runs:
+        store = {}
+        result = await replay(generate(store), args, store)
+        print(f"{name:<9} " + "  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                        for k, v in result.items()))
+    if args.metrics:
+        print("\n".join(metrics.summary()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--input", help="JSON lines file of recorded updates, replaces --scenario")
+    parser.add_argument("--updates", type=int, default=1000, help="updates per generated scenario")
+    parser.add_argument("--rate", type=float, default=0, help="updates per second, 0 – all at once")
+    parser.add_argument("--concurrency", type=int, default=256, help="concurrent updates, as CONCURRENT_UPDATES")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-errors", type=float, default=0.0, help="share of failing LLM requests")
+    parser.add_argument("--llm-batch", type=int, default=1, help="as LLM_BATCH_SIZE")
+    parser.add_argument("--firebase-latency", type=float, default=0.03)
+    parser.add_argument("--firebase-errors", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-errors", type=float, default=0.0)
+    parser.add_argument("--telegram-rate", type=float, default=10_000,
+                        help="outbound calls per second, global and per chat; high by default to measure the bot")
+    # The calls made are also replayed against these limits (main.py defaults) for telegram_drain_s.
+    parser.add_argument("--telegram-global-rate", type=float, default=30, help="as TELEGRAM_GLOBAL_RATE")
+    parser.add_argument("--telegram-chat-rate", type=float, default=20 / 60, help="as TELEGRAM_CHAT_RATE")
+    parser.add_argument("--telegram-chat-burst", type=int, default=20, help="as TELEGRAM_CHAT_BURST")
+    parser.add_argument("--tracemalloc", action="store_true", help="report peak traced Python allocations (slow)")
+    parser.add_argument("--metrics", action="store_true", help="print per-stage latencies and counters")
+    parser.add_argument("--log-level", default="CRITICAL")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,145 @@
+"""
+Concurrency stress test of strike increments.
+
+Several ModerationStore instances (standing in for shards or restarted processes) share one
+fake Realtime DB and add strikes to the same users concurrently. For every user the stored
+counter must equal the number of strikes added, and the values returned to the callers must
+be exactly 1..N, so that one and only one strike reaches the ban threshold.
+
+    python -m benchmarks.strike_stress --users 50 --strikes 20 --stores 4 --backend EXECUTOR REST
+    python -m benchmarks.strike_stress --legacy    # the former read-modify-write flow, for comparison
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+from benchmarks.firebase_loop_lag import FakeDb
+from services import FirebaseClient, FirebaseBackend, ModerationStore
+
+CHAT_ID = -1000
+
+
+class StressFirebaseClient(FirebaseClient):
+    def __init__(self, backend: FirebaseBackend, store: dict, latency: float, url: str = "http://127.0.0.1") -> None:
+        self.store, self.latency = store, latency
+        self.transactions = 0
+        super().__init__(firebase_url=url, secret="", backend=backend)
+
+    def _connect(self):
+        fake = FakeDb(self.latency)
+        fake.store = self.store
+        return fake
+
+    async def _access_token(self) -> str:
+        return "bench"
+
+    async def transaction(self, path: str, function) -> object:
+        self.transactions += 1
+        return await super().transaction(path, function)
+
+
+async def fake_rest_server(store: dict, latency: float) -> tuple[web.AppRunner, str]:
+    """Realtime DB REST subset: GET, PUT and PATCH at "/" with ETag conditional writes."""
+
+    def etag(value: object) -> str:
+        return hashlib.md5(json.dumps(value).encode()).hexdigest()
+
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        path = request.match_info["path"]
+        if request.method == "PATCH":
+            store.update(await request.json())
+            return web.json_response(None)
+        if request.method == "PUT":
+            value = await request.json()
+            expected = request.headers.get("if-match")
+            if expected is not None and expected != etag(store.get(path)):
+                return web.json_response(store.get(path), status=412, headers={"ETag": etag(store.get(path))})
+            store[path] = value
+            return web.json_response(value)
+        return web.json_response(store.get(path), headers={"ETag": etag(store.get(path))})
+
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}.json", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def legacy_strike(moderation: ModerationStore, user_id: int, latency: float) -> int:
+    """The former Bot.validate flow: read the cached count, punish, then write count + 1."""
+    strikes = moderation.get_strikes(CHAT_ID, user_id) + 1
+    await asyncio.sleep(random.uniform(0, latency))  # the punishment round trip
+    moderation.set_strikes(CHAT_ID, user_id, strikes)
+    return strikes
+
+
+async def run(backend: FirebaseBackend, args: argparse.Namespace) -> None:
+    store: dict = {}
+    runner, url = await fake_rest_server(store, args.latency) if backend is FirebaseBackend.REST else (None, "")
+    clients = [StressFirebaseClient(backend, store, args.latency, url or "http://127.0.0.1")
+               for _ in range(args.stores)]
+    stores = [ModerationStore(client) for client in clients]
+
+    calls = [(random.choice(stores), user_id) for user_id in range(args.users) for _ in range(args.strikes)]
+    random.shuffle(calls)
+
+    async def strike(moderation: ModerationStore, user_id: int) -> tuple[int, int]:
+        await asyncio.sleep(random.uniform(0, args.spread))
+        if args.legacy:
+            return user_id, await legacy_strike(moderation, user_id, args.latency)
+        return user_id, await moderation.add_strike(CHAT_ID, user_id)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(strike(moderation, user_id) for moderation, user_id in calls))
+    for moderation in stores:
+        await moderation.snapshot()
+    elapsed = time.perf_counter() - start
+
+    returned = defaultdict(list)
+    for user_id, count in results:
+        returned[user_id].append(count)
+    stored = {user_id: (store.get(f"moderation/{CHAT_ID}/{user_id}/strikes")
+                        or store.get("/", {}).get(f"moderation/{CHAT_ID}/{user_id}/strikes") or 0)
+              for user_id in range(args.users)}
+    lost = sum(args.strikes - stored[user_id] for user_id in range(args.users))
+    inconsistent = sum(sorted(counts) != list(range(1, args.strikes + 1)) for counts in returned.values())
+    transactions = sum(client.transactions for client in clients)
+
+    print(f"{backend.value:<9} {'legacy' if args.legacy else 'atomic':<7} strikes={len(calls)} "
+          f"transactions={transactions} lost={lost} users_with_wrong_counts={inconsistent} "
+          f"elapsed_s={elapsed:.2f}")
+
+    for client in clients:
+        await client.close()
+    if runner is not None:
+        await runner.cleanup()
+    if not args.legacy and (lost or inconsistent):
+        raise SystemExit("strike increments were lost or duplicated")
+
+
+async def main(args: argparse.Namespace) -> None:
+    for backend in args.backend:
+        await run(FirebaseBackend(backend.upper()), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--strikes", type=int, default=20, help="strikes per user")
+    parser.add_argument("--stores", type=int, default=4, help="ModerationStore instances sharing the DB")
+    parser.add_argument("--latency", type=float, default=0.005, help="fake DB round trip, seconds")
+    parser.add_argument("--spread", type=float, default=0.05, help="strikes start within this many seconds")
+    parser.add_argument("--backend", nargs="+", default=["EXECUTOR", "REST"],
+                        choices=["BLOCKING", "EXECUTOR", "REST"])
+    parser.add_argument("--legacy", action="store_true", help="use the former read-modify-write flow")
+    asyncio.run(main(parser.parse_args()))
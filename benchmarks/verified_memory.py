@@ -0,0 +1,62 @@
+"""
+Memory and lookup cost of the verified-user index.
+
+Builds VerifiedUsers over N random Telegram-like user ids and, for comparison, a plain
+Python set, then measures the memory each holds and the time of hit and miss lookups.
+
+    python -m benchmarks.verified_memory --users 1000000 10000000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from array import array
+
+from services.verified import VerifiedUsers
+
+MAX_USER_ID = 2 ** 40
+LOOKUPS = 200_000
+
+
+def lookup_ns(index, keys: list[int]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        key in index
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+def measure(name: str, build, ids: list[int]) -> None:
+    # Built from an array so the structure has to own fresh int objects, as it would in the bot.
+    source = array("q", ids)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = build(source)
+    build_s = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    hits = random.sample(ids, min(LOOKUPS, len(ids)))
+    misses = [random.randrange(1, MAX_USER_ID) for _ in range(LOOKUPS)]
+    print(f"  {name:<14} held_mb={held / 2 ** 20:8.1f}  bytes_per_user={held / len(ids):6.1f}  "
+          f"build_s={build_s:6.2f}  hit_ns={lookup_ns(index, hits):6.0f}  miss_ns={lookup_ns(index, misses):6.0f}")
+    del index, source
+
+
+def main(sizes: list[int], with_set: bool) -> None:
+    for size in sizes:
+        ids = [random.randrange(1, MAX_USER_ID) for _ in range(size)]
+        print(f"{size:,} users")
+        measure("array", lambda ids: VerifiedUsers(ids), ids)
+        if with_set:
+            measure("set", set, ids)
+        del ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--no-set", action="store_true", help="skip the Python set baseline")
+    args = parser.parse_args()
+    main(args.users, not args.no_set)
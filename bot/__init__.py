@@ -1,5 +1,43 @@
-from .bot import Bot
+import importlib
+
+# Submodules are imported on first attribute access (PEP 562), so a polling
+# process never pays for the webhook server or the sharding runtime.
+_EXPORTS = {
+    "Bot": ".bot",
+    "ChatOrderedUpdateProcessor": ".concurrency",
+    "ConcurrencyLimiter": ".concurrency",
+    "InProcessTransport": ".sharding",
+    "ProcessTransport": ".sharding",
+    "Transport": ".sharding",
+    "run_sharded": ".sharding",
+    "shard_of": ".sharding",
+    "WebhookServer": ".webhook",
+    "allowed_updates": ".webhook",
+    "serve_webhook": ".webhook",
+}
 
 __all__ = [
-    "Bot"
-]
\ No newline at end of file
+    "Bot",
+    "ChatOrderedUpdateProcessor",
+    "ConcurrencyLimiter",
+    "InProcessTransport",
+    "ProcessTransport",
+    "Transport",
+    "WebhookServer",
+    "allowed_updates",
+    "run_sharded",
+    "serve_webhook",
+    "shard_of",
+]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(__all__)
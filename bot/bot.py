@@ -1,26 +1,64 @@
+import asyncio
 import logging
 
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from typing import Awaitable
+
+from telegram import Update, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.error import TelegramError
 from telegram.ext import ContextTypes, BaseHandler, MessageHandler, filters
 from telegram.ext import CommandHandler
 
-from commands import Mute
-from services import LLMService, ConsoleLog, FirebaseLog, FirebaseClient
-from handlers import Admin, Auth
+from commands import Mute, Kick
+from commands.utils import admin_cache
+from services import LLMService, ConsoleLog, FirebaseLog, FirebaseClient, ModerationStore, PreFilter, \
+    FloodIndex, FloodAction, ActionScheduler, ActionPriority, VerifiedUsers, TimerScheduler, \
+    ChatContext
+from services.context import ContextMessage
+from services.metrics import metrics
+from handlers import Admin, Auth, Expiry
 from handlers.error import UserIsAdminError
+from .concurrency import ConcurrencyLimiter
 
 class Bot:
-    def __init__(self, llm_service: LLMService, firebase_client: FirebaseClient, firebase_log: FirebaseLog, console_log: ConsoleLog) -> None:
+    def __init__(self, llm_service: LLMService, firebase_client: FirebaseClient, firebase_log: FirebaseLog,
+                 console_log: ConsoleLog, moderation_store: ModerationStore, prefilter: PreFilter,
+                 llm_limiter: ConcurrencyLimiter, flood_index: FloodIndex,
+                 action_scheduler: ActionScheduler, flood_action: FloodAction = FloodAction.MUTE,
+                 greeting_window: float = 5.0, raid_joins: int = 30, raid_window: float = 60.0,
+                 raid_cooldown: float = 600.0, verified_users: VerifiedUsers | None = None,
+                 timers: TimerScheduler | None = None, strike_ttl: float = 7 * 24 * 3600,
+                 chat_context: ChatContext | None = None, context_tokens: int = 300,
+                 context_max_length: int = 0) -> None:
         self.llm_service = llm_service
         self.firebase_db = firebase_client
         self.firebase_logs = firebase_log
         self.console_logs = console_log.with_name(__name__)
+        self.moderation = moderation_store
+        self.prefilter = prefilter
+        self.llm_limiter = llm_limiter
+        self.flood_index = flood_index
+        self.flood_action = flood_action
+        self.actions = action_scheduler
+        self.verified_users = verified_users
+        self.timers = timers
+        self.chat_context = chat_context
+        self.context_tokens = context_tokens
+        self.context_max_length = context_max_length
+
+        self.admin = Admin(firebase_log=firebase_log, console_log=console_log, firebase_client=firebase_client,
+                           moderation_store=moderation_store, prefilter=prefilter, action_scheduler=action_scheduler,
+                           verdict_cache=llm_service.verdict_cache, timers=timers)
+        self.auth = Auth(firebase_client=firebase_client, action_scheduler=action_scheduler,
+                         greeting_window=greeting_window, raid_joins=raid_joins, raid_window=raid_window,
+                         raid_cooldown=raid_cooldown, verified_users=verified_users)
 
-        self.admin = Admin(firebase_log=firebase_log, console_log=console_log, firebase_client=firebase_client)
-        self.auth = Auth(firebase_client=firebase_client)
+        self.expiry = Expiry(timers=timers, firebase_log=firebase_log, console_log=console_log,
+                             moderation_store=moderation_store, action_scheduler=action_scheduler,
+                             strike_ttl=strike_ttl) if timers is not None else None
 
-        self.mute_handler = Mute(firebase_log=firebase_log, console_log=console_log)
+        self.mute_handler = Mute(firebase_log=firebase_log, console_log=console_log, action_scheduler=action_scheduler,
+                                 moderation_store=moderation_store, timers=timers)
+        self.kick_handler = Kick(console_log=console_log, action_scheduler=action_scheduler)
 
     def handlers(self) -> list[BaseHandler]:
         return [
@@ -32,45 +70,109 @@ class Bot:
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Send a message when the command /help is issued."""
-        await update.message.reply_text("Help!")
+        await self.actions.run(ActionPriority.NOTIFY, update.message.chat_id, update.message.reply_text, "Help!")
 
     async def validate(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Validate the message sent by the user."""
-        status, reason = await self.llm_service.validate_message(update.message.text)
         msg = update.message
+        if self.chat_context is not None:
+            self.chat_context.record(msg.chat_id, msg.message_id, msg.from_user.id, msg.text,
+                                     msg.reply_to_message.message_id if msg.reply_to_message else None)
+        if await admin_cache.is_admin(msg.chat, msg.from_user.id):
+            return
+        flood = self.flood_index.observe(msg.chat_id, msg.from_user.id, msg.text)
+        source = "prefilter"
+        verdict = self.prefilter.check(msg.chat_id, msg.text)
+        if verdict is None:
+            source = "flood" if flood.shared else "llm"
+            verdict = await self.flood_index.classify(flood, lambda: self.ask_llm(msg))
+        else:
+            self.flood_index.record_verdict(flood, verdict)
+        status, reason = verdict
+        metrics.inc("verdicts_total", status="unsafe" if 'unsafe' in status else "safe", source=source)
+        if flood.is_flood and 'unsafe' in status:
+            # Only copies of an unsafe message are flood: a greeting repeated by many users is not.
+            await self.punish_flood(context, update)
+            return
         if 'unsafe' in status:
             ask_keyboard = InlineKeyboardMarkup(
                 [[InlineKeyboardButton("Обжаловать наказание", callback_data="ask_data")]])
-            try:
-                user_moderation = await self.firebase_db.read(f"moderation/{msg.chat_id}/{msg.from_user.id}")
-                if user_moderation is not None:
-                    strike_count = user_moderation.get('strikes', 0)
-                else:
-                    strike_count = 0
-                strike_count += 1
-                if strike_count >= 3:
-                    await context.bot.ban_chat_member(chat_id=msg.chat_id, user_id=msg.from_user.id)
-                    await context.bot.send_message(chat_id=msg.from_user.id,
-                                                   text=f'Вы были забанены за сообщение: '
-                                                        f'{update.message.text}\nПричина: {reason}\n'
-                                                   f'Количество нарушений: {strike_count}/3',
-                                                   reply_markup=ask_keyboard)
-                else:
-                    await self.mute_handler.mute_user(context, update.message.text, msg.chat_id,
-                                                      msg.from_user.id, reason, "1h")
-                    await context.bot.send_message(chat_id=msg.from_user.id,
-                                                   text=f'Вы были замьючены на 1 час за сообщение: '
-                                                        f'{update.message.text}\nПричина: {reason}\n'
-                                                   f'Количество нарушений: {strike_count}/3',
-                                                   reply_markup=ask_keyboard)
-                await self.firebase_db.update(f"moderation/{msg.chat_id}/{msg.from_user.id}",
-                                              {"strikes": strike_count})
-            except TelegramError:
-                raise UserIsAdminError(f'Не удалось заблокировать пользователя {msg.from_user.username}, т.к. он является администратором чата.')
-            await update.message.delete()
+            strike_count = await self.moderation.add_strike(msg.chat_id, msg.from_user.id)
+            if self.expiry is not None:
+                self.expiry.strike_added(msg.chat_id, msg.from_user.id)
+            if strike_count >= 3:
+                punishment = self.actions.run(ActionPriority.PUNITIVE, msg.chat_id, context.bot.ban_chat_member,
+                                              chat_id=msg.chat_id, user_id=msg.from_user.id)
+                text = (f'Вы были забанены за сообщение: '
+                        f'{update.message.text}\nПричина: {reason}\n'
+                        f'Количество нарушений: {strike_count}/3')
+            else:
+                punishment = self.mute_handler.mute_user(context, update.message.text, msg.chat_id,
+                                                         msg.from_user.id, reason, "1h")
+                text = (f'Вы были замьючены на 1 час за сообщение: '
+                        f'{update.message.text}\nПричина: {reason}\n'
+                        f'Количество нарушений: {strike_count}/3')
+            notification = self.actions.run(ActionPriority.NOTIFY, msg.from_user.id, context.bot.send_message,
+                                            chat_id=msg.from_user.id, text=text, reply_markup=ask_keyboard)
+            await self.enforce(msg, punishment, notification)
+
+    async def ask_llm(self, msg: Message) -> tuple[str, str]:
+        async with self.llm_limiter.limit(msg.chat_id):
+            return await self.llm_service.validate_message_cached(msg.text, self.context_of(msg))
+
+    def context_of(self, msg: Message) -> str:
+        """
+        The previous messages of the chat that fit in the token budget, rendered for the LLM.
+        Only replies (and, with context_max_length, standalone messages up to that length) get a context:
+        the others are judged alone, so their verdicts stay cacheable (the context is part of the cache key).
+        """
+        reply = msg.reply_to_message
+        if self.chat_context is None or (reply is None and len(msg.text) > self.context_max_length):
+            return ""
+        window = self.chat_context.window(msg.chat_id, self.context_tokens, before=msg.message_id,
+                                          reply_to=reply.message_id if reply else None)
+        if reply is not None and (reply.text or reply.caption) \
+                and all(record.message_id != reply.message_id for record in window):
+            # Older than the buffer: Telegram sends the replied message along with the reply.
+            window.insert(0, ContextMessage(reply.message_id, reply.from_user.id if reply.from_user else 0,
+                                            (reply.text or reply.caption)[:self.chat_context.max_text], None))
+        if not window:
+            return ""
+        context = self.chat_context.render(window)
+        if reply is not None:
+            context += f"\nПроверяемое сообщение – ответ на #{reply.message_id}"
+        return context
+
+    async def punish_flood(self, context: ContextTypes.DEFAULT_TYPE, update: Update) -> None:
+        """Mute or kick the sender of a near-duplicate copy of an unsafe message (the cluster verdict is reused)."""
+        msg = update.message
+        match self.flood_action:
+            case FloodAction.KICK:
+                punishment = self.kick_handler.kick_user(context, msg.chat_id, msg.from_user.id)
+            case _:
+                punishment = self.mute_handler.mute_user(context, msg.text, msg.chat_id, msg.from_user.id,
+                                                         "Флуд одинаковыми сообщениями", "1h")
+        await self.enforce(msg, punishment)
+
+    async def enforce(self, msg: Message, punishment: Awaitable, *notifications: Awaitable) -> None:
+        """Run the punishment, the deletion of the message and the notifications concurrently."""
+        deletion = self.actions.run(ActionPriority.DELETE, msg.chat_id, msg.delete)
+        punished, *rest = await asyncio.gather(punishment, deletion, *notifications, return_exceptions=True)
+        if isinstance(punished, TelegramError):
+            raise UserIsAdminError(f'Не удалось заблокировать пользователя {msg.from_user.username}, т.к. он является администратором чата.')
+        if isinstance(punished, BaseException):
+            raise punished
+        for result in rest:
+            if isinstance(result, BaseException):
+                await self.console_logs.awrite(status=logging.WARNING, msg=f"Moderation side action failed: {result!r}",
+                                               chat_id=msg.chat_id, user_id=msg.from_user.id)
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Log the error and send a telegram message to notify the developer."""
+        metrics.inc("handler_errors_total", error=type(context.error).__name__)
         if isinstance(update, Update) and update.message:
-            await self.console_logs.awrite(status=logging.ERROR, msg=f'Message "{update.message.text}" caused error: {context.error}')
-            await update.message.reply_text(text=str(context.error))
+            await self.console_logs.awrite(status=logging.ERROR, msg=f'Message "{update.message.text}" caused error: {context.error}',
+                                           chat_id=update.message.chat_id,
+                                           user_id=update.effective_user.id if update.effective_user else None)
+            await self.actions.run(ActionPriority.NOTIFY, update.message.chat_id, update.message.reply_text,
+                                   text=str(context.error))
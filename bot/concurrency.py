@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLocks:
+    """asyncio locks created on demand per key and dropped once nobody holds or waits for them."""
+
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates concurrently across chats while keeping the updates
+    of one user in one chat strictly in arrival order.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 256) -> None:
+        super().__init__(max_concurrent_updates=max_concurrent_updates)
+        self._keys = KeyedLocks()
+
+    @staticmethod
+    def ordering_key(update: object) -> Hashable | None:
+        if not isinstance(update, Update):
+            return None
+        chat = update.effective_chat
+        user = update.effective_user
+        if chat is None and user is None:
+            return None
+        return chat.id if chat else None, user.id if user else None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Wait for our turn inside the chat before taking a global slot,
+        # so a busy chat cannot hold slots other chats could use.
+        key = self.ordering_key(update)
+        if key is None:
+            return await super().process_update(update, coroutine)
+        async with self._keys.hold(key):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class ConcurrencyLimiter:
+    """Global and per-chat limits on concurrent calls (used for LLM requests)."""
+
+    def __init__(self, global_limit: int = 16, per_chat_limit: int = 2) -> None:
+        self.global_limit = global_limit
+        self.per_chat_limit = per_chat_limit
+        self._global = asyncio.Semaphore(global_limit)
+        self._chats: dict[int, tuple[asyncio.Semaphore, int]] = {}
+
+    @asynccontextmanager
+    async def limit(self, chat_id: int):
+        semaphore, users = self._chats.get(chat_id, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_chat_limit)
+        self._chats[chat_id] = (semaphore, users + 1)
+        try:
+            async with semaphore, self._global:
+                yield
+        finally:
+            semaphore, users = self._chats[chat_id]
+            if users == 1:
+                del self._chats[chat_id]
+            else:
+                self._chats[chat_id] = (semaphore, users - 1)
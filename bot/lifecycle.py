@@ -0,0 +1,23 @@
+from contextlib import asynccontextmanager
+
+from telegram.ext import Application
+
+
+@asynccontextmanager
+async def running(application: Application):
+    """
+    Initialize and start the application with its post_* hooks, like run_polling does,
+    for runtimes that feed application.update_queue themselves.
+    """
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            yield application
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from datetime import timedelta
+from typing import Callable, Protocol
+
+from telegram import Bot as TelegramBot, Update
+from telegram.error import NetworkError, RetryAfter
+from telegram.ext import Application
+
+from .lifecycle import running
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(key: int, shards: int) -> int:
+    """Shard that owns the chat. Stable across processes, unlike hash() of a str."""
+    return key % shards
+
+
+def routing_key(update: Update) -> int:
+    """Chat of the update, so every update of one chat lands on the same worker."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return 0
+
+
+class Transport(Protocol):
+    """Carries serialized updates from the front process to the workers; None stops a worker."""
+
+    async def send(self, shard: int, payload: dict | None) -> None: ...
+
+    async def receive(self, shard: int) -> dict | None: ...
+
+
+class InProcessTransport:
+    """Transport for workers running as tasks of one event loop, for local runs and tests."""
+
+    def __init__(self, shards: int) -> None:
+        self._queues = [asyncio.Queue() for _ in range(shards)]
+
+    async def send(self, shard: int, payload: dict | None) -> None:
+        await self._queues[shard].put(payload)
+
+    async def receive(self, shard: int) -> dict | None:
+        return await self._queues[shard].get()
+
+
+class ProcessTransport:
+    """Transport over multiprocessing queues for workers running in their own processes."""
+
+    def __init__(self, shards: int, context: multiprocessing.context.BaseContext | None = None) -> None:
+        context = context or multiprocessing.get_context("spawn")
+        self._queues = [context.Queue() for _ in range(shards)]
+
+    async def send(self, shard: int, payload: dict | None) -> None:
+        self._queues[shard].put(payload)
+
+    async def receive(self, shard: int) -> dict | None:
+        return await asyncio.get_running_loop().run_in_executor(None, self._queues[shard].get)
+
+
+async def serve_shard(application: Application, transport: Transport, shard: int) -> None:
+    """Feed the updates routed to the shard into the application until the front sends None."""
+    async with running(application):
+        while (payload := await transport.receive(shard)) is not None:
+            await application.update_queue.put(Update.de_json(payload, application.bot))
+
+
+async def route_updates(bot: TelegramBot, transport: Transport, shards: int, allowed_updates: list[str],
+                        stop: asyncio.Event, timeout: int = 30) -> None:
+    """Long-poll Telegram and forward every update to the shard of its chat until stop is set."""
+    offset = None
+    async with bot:
+        await bot.delete_webhook()
+        while not stop.is_set():
+            poll = asyncio.create_task(bot.get_updates(offset=offset, timeout=timeout,
+                                                       allowed_updates=allowed_updates))
+            stopped = asyncio.create_task(stop.wait())
+            await asyncio.wait((poll, stopped), return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta)
+                                    else e.retry_after)
+                continue
+            except NetworkError as e:
+                logger.warning(f"Polling failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await transport.send(shard_of(routing_key(update), shards), update.to_dict())
+        if offset is not None:
+            # Confirm the routed updates so a restart does not deliver them again.
+            await bot.get_updates(offset=offset, timeout=0)
+
+
+def _worker_main(build: Callable[[int, int], Application], transport: Transport, shard: int, shards: int) -> None:
+    # The front process owns shutdown: it sends None after Ctrl+C reaches the whole process group.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_shard(build(shard, shards), transport, shard))
+
+
+async def run_sharded(bot: TelegramBot, build: Callable[[int, int], Application], shards: int,
+                      allowed_updates: list[str], in_process: bool = False) -> None:
+    """
+    Run shards workers, each with its own application built by build(shard, shards),
+    behind a front that polls Telegram and routes updates by chat_id.
+    build: module-level function (it is pickled into the worker processes).
+    in_process: run the workers as tasks of this event loop instead of processes.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if in_process:
+        transport = InProcessTransport(shards)
+        workers = [asyncio.create_task(serve_shard(build(shard, shards), transport, shard))
+                   for shard in range(shards)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        transport = ProcessTransport(shards, context)
+        processes = [context.Process(target=_worker_main, args=(build, transport, shard, shards),
+                                     name=f"shard-{shard}") for shard in range(shards)]
+        for process in processes:
+            process.start()
+        workers = [loop.run_in_executor(None, process.join) for process in processes]
+
+    try:
+        await route_updates(bot, transport, shards, allowed_updates, stop)
+    finally:
+        for shard in range(shards):
+            await transport.send(shard, None)
+        await asyncio.gather(*workers, return_exceptions=True)
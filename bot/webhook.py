@@ -0,0 +1,96 @@
+import asyncio
+import hmac
+import signal
+from typing import TYPE_CHECKING
+
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CallbackQueryHandler, ChatMemberHandler, CommandHandler, \
+    MessageHandler
+
+from .lifecycle import running
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+def allowed_updates(handlers: list[BaseHandler]) -> list[str]:
+    """Update types the handlers can consume, so Telegram does not send the others."""
+    types = set()
+    for handler in handlers:
+        match handler:
+            case CommandHandler() | MessageHandler():
+                types.add(Update.MESSAGE)
+            case ChatMemberHandler():
+                if handler.chat_member_types in (ChatMemberHandler.CHAT_MEMBER, ChatMemberHandler.ANY_CHAT_MEMBER):
+                    types.add(Update.CHAT_MEMBER)
+                if handler.chat_member_types in (ChatMemberHandler.MY_CHAT_MEMBER, ChatMemberHandler.ANY_CHAT_MEMBER):
+                    types.add(Update.MY_CHAT_MEMBER)
+            case CallbackQueryHandler():
+                types.add(Update.CALLBACK_QUERY)
+            case _:
+                return list(Update.ALL_TYPES)
+    return sorted(types)
+
+
+class WebhookServer:
+    """Embedded aiohttp server that feeds webhook updates straight into the application's update queue."""
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(self, application: Application, secret_token: str, path: str = "/telegram",
+                 host: str = "0.0.0.0", port: int = 8080) -> None:
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self._runner: "web.AppRunner | None" = None
+
+    async def handle(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+        if not hmac.compare_digest(request.headers.get(self.SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except ValueError:
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self) -> None:
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve_webhook(application: Application, url: str, secret_token: str, path: str = "/telegram",
+                        host: str = "0.0.0.0", port: int = 8080, register: bool = True) -> None:
+    """
+    Run the application on webhook updates until SIGINT/SIGTERM.
+    url: public base URL Telegram posts to (path is appended).
+    register: call setWebhook; disable when driving the server with a local fake Telegram.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(application, secret_token, path=path, host=host, port=port)
+    async with running(application):
+        if register:
+            await application.bot.set_webhook(url=url.rstrip("/") + path, secret_token=secret_token,
+                                              allowed_updates=allowed_updates(
+                                                  [h for group in application.handlers.values() for h in group]))
+        await server.start()
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
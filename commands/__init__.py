@@ -2,10 +2,16 @@ from .mute import Mute
 from .ban import Ban
 from .kick import Kick
 from .strike import Strike
+from .lexicon import Lexicon
+from .stats import Stats
+from .modlog import ModLog
 
 __all__ = [
     "Mute",
     "Ban",
     "Kick",
     "Strike",
+    "Lexicon",
+    "Stats",
+    "ModLog",
 ]
\ No newline at end of file
@@ -1,17 +1,17 @@
 from datetime import datetime, timezone, timedelta
 from typing import Self
 from enum import Enum
-from json import dumps
 
 from telegram import Update
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from services import FirebaseLog, ConsoleLog
-from services.log import FirebaseAction
+from services import FirebaseLog, ConsoleLog, ActionScheduler, ActionPriority
+from services.log import FirebaseAction, FirebaseLogFormat
+from services.timers import TimerScheduler, TimerKind
 
 from .utils import parse_duration, is_admin
-from handlers.error import MissingDurationError, UserNotRepliedError, MissingReasonError
+from handlers.error import MissingDurationError, UserNotRepliedError, MissingReasonError, UserIsAdminError
 
 
 class Additions(Enum):
@@ -21,11 +21,14 @@ class Additions(Enum):
 
 
 class Ban:
-    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog) -> None:
+    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog, action_scheduler: ActionScheduler,
+                 timers: TimerScheduler | None = None) -> None:
         self.adds: set[Additions] = set()
         self.invert: bool = False
         self.firebase_logs = firebase_log
         self.console_logs = console_log.with_name(__name__)
+        self.actions = action_scheduler
+        self.timers = timers
 
     def with_delete(self) -> Self:
         """
@@ -69,19 +72,21 @@ class Ban:
 
         if not self.invert and Additions.TIMER in self.adds:
             try:
-                duration = parse_duration(context.args[0])
+                duration = parse_duration(context.args[1])
                 until_date = datetime.now(timezone.utc) + timedelta(seconds=duration)
             except IndexError:
                 raise MissingDurationError(f"Не указано время для бана")
 
         try:
             if self.invert:
-                await context.bot.unban_chat_member(
+                await self.actions.run(
+                    ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.unban_chat_member,
                     chat_id=update.effective_chat.id,
                     user_id=update.message.reply_to_message.from_user.id
                 )
             else:
-                await context.bot.ban_chat_member(
+                await self.actions.run(
+                    ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.ban_chat_member,
                     chat_id=update.effective_chat.id,
                     user_id=update.message.reply_to_message.from_user.id,
                     until_date=until_date,
@@ -92,24 +97,28 @@ class Ban:
         except BadRequest:
             raise UserIsAdminError(f"Команда не применима к администраторам.")
 
+        self._schedule_end(update.effective_chat.id, update.message.reply_to_message.from_user.id, until_date)
+
         if not Additions.SILENT in self.adds:
             if not self.invert:
-                await context.bot.send_message(update.effective_chat.id,
-                                           f"Пользователь @{update.message.reply_to_message.from_user.username} забанен!")
+                await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                                       update.effective_chat.id,
+                                       f"Пользователь @{update.message.reply_to_message.from_user.username} забанен!")
             else:
-                await context.bot.send_message(update.effective_chat.id,
-                                               f"Пользователь @{update.message.reply_to_message.from_user.username} разбанен! 🥳")
-
-        log = {
-            "user_id": update.message.reply_to_message.from_user.id,
-            "chat_id": update.effective_chat.id,
-            "message": update.message.reply_to_message.text,
-            "reason": reason if reason else "Не указано",
-        }
+                await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                                       update.effective_chat.id,
+                                       f"Пользователь @{update.message.reply_to_message.from_user.username} разбанен! 🥳")
+
+        log = FirebaseLogFormat(
+            user_id=update.message.reply_to_message.from_user.id,
+            chat_id=update.effective_chat.id,
+            message=update.message.reply_to_message.text,
+            reason=reason if reason else "Не указано",
+        )
         if not self.invert:
-            await self.firebase_logs.awrite(FirebaseAction.BAN, dumps(log))
+            await self.firebase_logs.awrite(FirebaseAction.BAN, log)
         else:
-            await self.firebase_logs.awrite(FirebaseAction.UNBAN, dumps(log))
+            await self.firebase_logs.awrite(FirebaseAction.UNBAN, log)
 
     async def ban_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE, duration: str = None):
         if duration:
@@ -118,9 +127,20 @@ class Ban:
         else:
             until_date = None
 
-        await context.bot.ban_chat_member(
+        await self.actions.run(
+            ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.ban_chat_member,
             chat_id=update.effective_chat.id,
             user_id=update.message.reply_to_message.from_user.id,
             until_date=until_date,
             revoke_messages=True
         )
+        self._schedule_end(update.effective_chat.id, update.message.reply_to_message.from_user.id, until_date)
+
+    def _schedule_end(self, chat_id: int, user_id: int, until_date: datetime | None) -> None:
+        """Remember when a timed ban ends; a permanent ban or an unban drops the pending end."""
+        if self.timers is None:
+            return
+        if until_date is not None:
+            self.timers.schedule(TimerKind.UNBAN, chat_id, user_id, until_date.timestamp())
+        else:
+            self.timers.cancel(TimerKind.UNBAN, chat_id, user_id)
@@ -5,7 +5,7 @@ from telegram import Update
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from services import ConsoleLog
+from services import ConsoleLog, ActionScheduler, ActionPriority
 from handlers.error import UserNotRepliedError, UserIsAdminError
 from .utils import is_admin
 
@@ -15,9 +15,10 @@ class Additions(Enum):
 
 
 class Kick:
-    def __init__(self, console_log: ConsoleLog) -> None:
+    def __init__(self, console_log: ConsoleLog, action_scheduler: ActionScheduler) -> None:
         self.adds: set[Additions] = set()
         self.console_logs = console_log.with_name(__name__)
+        self.actions = action_scheduler
 
     def with_delete(self) -> Self:
         """
@@ -37,12 +38,14 @@ class Kick:
         if not await is_admin(update):
             raise UserIsAdminError("Команда доступна только администраторам.")
         try:
-            await context.bot.ban_chat_member(
+            await self.actions.run(
+                ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.ban_chat_member,
                 chat_id=update.effective_chat.id,
                 user_id=update.message.reply_to_message.from_user.id,
                 revoke_messages=True if Additions.DELETE in self.adds else False
             )
-            await context.bot.unban_chat_member(
+            await self.actions.run(
+                ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.unban_chat_member,
                 chat_id=update.effective_chat.id,
                 user_id=update.message.reply_to_message.from_user.id,
             )
@@ -54,16 +57,19 @@ class Kick:
         if Additions.SILENT in self.adds:
             return
 
-        await context.bot.send_message(update.effective_chat.id,
-                                       f"Пользователь @{update.message.reply_to_message.from_user.username} Кикнут.")
+        await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                               update.effective_chat.id,
+                               f"Пользователь @{update.message.reply_to_message.from_user.username} Кикнут.")
 
     async def kick_user(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> None:
-        await context.bot.ban_chat_member(
+        await self.actions.run(
+            ActionPriority.PUNITIVE, chat_id, context.bot.ban_chat_member,
             chat_id=chat_id,
             user_id=user_id,
             revoke_messages=True
         )
-        await context.bot.unban_chat_member(
+        await self.actions.run(
+            ActionPriority.PUNITIVE, chat_id, context.bot.unban_chat_member,
             chat_id=chat_id,
             user_id=user_id,
         )
\ No newline at end of file
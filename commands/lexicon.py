@@ -0,0 +1,69 @@
+from enum import Enum
+from typing import Self
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from services import ConsoleLog, FirebaseClient, PreFilter
+from .utils import is_admin
+from handlers.error import UserIsAdminError, MissingWordError
+
+
+class Additions(Enum):
+    BLOCK = "BLOCK"
+    ALLOW = "ALLOW"
+    REMOVE = "REMOVE"
+
+
+class Lexicon:
+    def __init__(self, console_log: ConsoleLog, firebase_db: FirebaseClient, prefilter: PreFilter) -> None:
+        self.console_logs = console_log.with_name(__name__)
+        self.firebase_db = firebase_db
+        self.prefilter = prefilter
+        self.adds: set[Additions] = set()
+
+    def block(self) -> Self:
+        """
+        Messages with words starting with the given one are removed without asking the LLM.
+        """
+        self.adds.add(Additions.BLOCK)
+        return self
+
+    def allow(self) -> Self:
+        """
+        The given word is never treated as a forbidden one in this chat.
+        """
+        self.adds.add(Additions.ALLOW)
+        return self
+
+    def remove(self) -> Self:
+        """
+        Remove the given word from the chat's word lists.
+        """
+        self.adds.add(Additions.REMOVE)
+        return self
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not await is_admin(update):
+            raise UserIsAdminError("Команда доступна только администраторам.")
+
+        try:
+            word = self.prefilter.normalize(context.args[0])
+        except IndexError:
+            raise MissingWordError("Не указано слово – необходимо указать слово после команды")
+        if any(char in word for char in ".$#[]/"):
+            raise MissingWordError("Слово не должно содержать символы . $ # [ ] /")
+
+        chat_id = update.effective_chat.id
+        if Additions.BLOCK in self.adds:
+            self.prefilter.block_word(chat_id, word)
+            await self.firebase_db.update(f"lexicon/{chat_id}", {f"blocked/{word}": True, f"allowed/{word}": None})
+            await context.bot.send_message(chat_id, f"Слово «{word}» добавлено в запрещённые")
+        elif Additions.ALLOW in self.adds:
+            self.prefilter.allow_word(chat_id, word)
+            await self.firebase_db.update(f"lexicon/{chat_id}", {f"allowed/{word}": True, f"blocked/{word}": None})
+            await context.bot.send_message(chat_id, f"Слово «{word}» добавлено в разрешённые")
+        elif Additions.REMOVE in self.adds:
+            self.prefilter.remove_word(chat_id, word)
+            await self.firebase_db.update(f"lexicon/{chat_id}", {f"allowed/{word}": None, f"blocked/{word}": None})
+            await context.bot.send_message(chat_id, f"Слово «{word}» удалено из списков чата")
@@ -0,0 +1,103 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from services import ConsoleLog, FirebaseClient, ActionScheduler, ActionPriority
+from services.log import FirebaseAction
+from .utils import is_admin
+from handlers.error import UserIsAdminError
+
+CURSOR_LENGTH = 20  # length of a push id
+
+
+class ModLog:
+    """
+    /modlog [BAN|UNBAN|MUTE|UNMUTE] [user_id] [cursor] — moderation history of the chat, newest first.
+    As a reply, the history of the author of the message. The reply ends with the command for the next page.
+    /modlog stats [days] — number of actions per day from the rollup counters.
+    """
+
+    def __init__(self, console_log: ConsoleLog, firebase_client: FirebaseClient, action_scheduler: ActionScheduler,
+                 page_size: int = 10) -> None:
+        self.console_logs = console_log.with_name(__name__)
+        self.firebase_db = firebase_client
+        self.actions = action_scheduler
+        self.page_size = page_size
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not await is_admin(update):
+            raise UserIsAdminError("Команда доступна только администраторам.")
+
+        chat_id = update.effective_chat.id
+        args = context.args or []
+        if args and args[0].lower() == "stats":
+            days = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
+            text = await self.summary(chat_id, days)
+        else:
+            action, user_id, cursor = None, None, None
+            for arg in args:
+                if arg.upper() in FirebaseAction.__members__:
+                    action = FirebaseAction[arg.upper()]
+                elif len(arg) == CURSOR_LENGTH:
+                    cursor = arg
+                elif arg.isdigit():
+                    user_id = int(arg)
+            reply = update.message.reply_to_message
+            if user_id is None and reply is not None and reply.from_user is not None:
+                user_id = reply.from_user.id
+            text = await self.page(chat_id, action, user_id, cursor)
+        await self.actions.run(ActionPriority.NOTIFY, chat_id, context.bot.send_message, chat_id, text[:4096])
+
+    async def page(self, chat_id: int, action: FirebaseAction | None, user_id: int | None,
+                   cursor: str | None) -> str:
+        """One page of entries ending at cursor (inclusive), read from the narrowest index."""
+        if user_id is not None:
+            index = await self.firebase_db.query(f"logs_by_user/{chat_id}/{user_id}", self.page_size + 1, cursor)
+        elif action is not None:
+            index = await self.firebase_db.query(f"logs_by_action/{chat_id}/{action.value}", self.page_size + 1, cursor)
+        else:
+            index = await self.firebase_db.query(f"logs/{chat_id}", self.page_size + 1, cursor)
+        next_cursor, keys = self._split(list(index))
+
+        if user_id is None and action is None:
+            entries = [index[key] for key in keys]
+        else:
+            # The user index holds the action of each entry: filter before reading the entries.
+            if user_id is not None and action is not None:
+                keys = [key for key in keys if index[key] == action.value]
+            entries = list((await self.firebase_db.read_many([f"logs/{chat_id}/{key}" for key in keys])).values())
+
+        lines = [self._format(entry) for entry in reversed(entries) if isinstance(entry, dict)]
+        if not lines:
+            lines.append("Записей нет.")
+        if next_cursor is not None:
+            filters = " ".join(arg for arg in (action.value if action else None,
+                                               str(user_id) if user_id is not None else None) if arg)
+            lines.append(f"\nДалее: /modlog {filters + ' ' if filters else ''}{next_cursor}")
+        return "\n".join(lines)
+
+    async def summary(self, chat_id: int, days: int) -> str:
+        """Counts per day and action of the last `days` days with actions; no raw entry is read."""
+        rollup = await self.firebase_db.query(f"logs_rollup/{chat_id}", days)
+        if not rollup:
+            return "Записей нет."
+        totals = Counter()
+        lines = []
+        for day, counts in reversed(rollup.items()):
+            totals.update(counts)
+            lines.append(f"{day}: " + ", ".join(f"{action}={count}" for action, count in sorted(counts.items())))
+        lines.append("Всего: " + ", ".join(f"{action}={count}" for action, count in sorted(totals.items())))
+        return "\n".join(lines)
+
+    def _split(self, keys: list[str]) -> tuple[str | None, list[str]]:
+        """The query reads one key more than a page: it is the cursor of the next page."""
+        if len(keys) > self.page_size:
+            return keys[0], keys[1:]
+        return None, keys
+
+    @staticmethod
+    def _format(entry: dict) -> str:
+        when = datetime.fromtimestamp(entry.get("timestamp", 0) / 1000, timezone.utc).strftime("%d.%m.%Y %H:%M")
+        return f"{when} {entry.get('action')} {entry.get('user_id')} — {entry.get('reason')}"
@@ -1,14 +1,14 @@
 from datetime import datetime, timezone, timedelta
 from typing import Self
 from enum import Enum
-from json import dumps
 
 from telegram import Update, ChatPermissions
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from services import FirebaseLog, ConsoleLog
-from services.log import FirebaseAction
+from services import FirebaseLog, ConsoleLog, ModerationStore, ActionScheduler, ActionPriority
+from services.log import FirebaseAction, FirebaseLogFormat
+from services.timers import TimerScheduler, TimerKind
 from .utils import parse_duration, is_admin
 from handlers.error import UserNotRepliedError, MissingDurationError, MissingReasonError, UserIsAdminError
 
@@ -20,11 +20,15 @@ class Additions(Enum):
 
 
 class Mute:
-    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog) -> None:
+    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog, action_scheduler: ActionScheduler,
+                 moderation_store: ModerationStore | None = None, timers: TimerScheduler | None = None) -> None:
         self.adds: set[Additions] = set()
         self.invert: bool = False
         self.firebase_logs = firebase_log
         self.console_logs = console_log.with_name(__name__)
+        self.actions = action_scheduler
+        self.moderation = moderation_store
+        self.timers = timers
 
     def with_delete(self) -> Self:
         """
@@ -75,7 +79,8 @@ class Mute:
 
         # TODO: Нужно давать юзеру не все права, а только те, которые у него были
         try:
-            await context.bot.restrict_chat_member(
+            await self.actions.run(
+                ActionPriority.PUNITIVE, update.effective_chat.id, context.bot.restrict_chat_member,
                 chat_id=update.effective_chat.id,
                 user_id=update.message.reply_to_message.from_user.id,
                 permissions=ChatPermissions.no_permissions() if not self.invert else ChatPermissions.all_permissions(),
@@ -86,28 +91,32 @@ class Mute:
         except BadRequest:
             raise UserIsAdminError(f"Команда не применима к администраторам.")
 
+        self._schedule_end(update.effective_chat.id, update.message.reply_to_message.from_user.id, until_date)
+
         if not self.invert and Additions.DELETE in self.adds:
-            await update.message.reply_to_message.delete()
+            await self.actions.run(ActionPriority.DELETE, update.effective_chat.id, update.message.reply_to_message.delete)
 
         if not Additions.SILENT in self.adds:
             if not self.invert:
-                await context.bot.send_message(update.effective_chat.id,
-                                           f"Пользователь @{update.message.reply_to_message.from_user.username} в мьюте 🤫")
+                await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                                       update.effective_chat.id,
+                                       f"Пользователь @{update.message.reply_to_message.from_user.username} в мьюте 🤫")
             else:
-                await context.bot.send_message(update.effective_chat.id,
-                                               f"Пользователь @{update.message.reply_to_message.from_user.username} разговаривает! 🥳")
-
-        log = {
-            "user_id": update.message.reply_to_message.from_user.id,
-            "chat_id": update.effective_chat.id,
-            "message": update.message.reply_to_message.text,
-            "reason": reason if reason else "Не указано",
-        }
+                await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                                       update.effective_chat.id,
+                                       f"Пользователь @{update.message.reply_to_message.from_user.username} разговаривает! 🥳")
+
+        log = FirebaseLogFormat(
+            user_id=update.message.reply_to_message.from_user.id,
+            chat_id=update.effective_chat.id,
+            message=update.message.reply_to_message.text,
+            reason=reason if reason else "Не указано",
+        )
 
         if not self.invert:
-            await self.firebase_logs.awrite(FirebaseAction.MUTE, dumps(log))
+            await self.firebase_logs.awrite(FirebaseAction.MUTE, log)
         else:
-            await self.firebase_logs.awrite(FirebaseAction.UNMUTE, dumps(log))
+            await self.firebase_logs.awrite(FirebaseAction.UNMUTE, log)
 
 
     async def mute_user(self, context: ContextTypes.DEFAULT_TYPE,
@@ -119,16 +128,29 @@ class Mute:
         else:
             until_date = None
 
-        await self.firebase_logs.awrite(FirebaseAction.MUTE, dumps({
-            "user_id": user_id,
-            "chat_id": chat_id,
-            "message": message,
-            "reason": f"Автоматическая модерация (LLM) -> {reason_llm}",
-        }))
+        await self.firebase_logs.awrite(FirebaseAction.MUTE, FirebaseLogFormat(
+            user_id=user_id,
+            chat_id=chat_id,
+            message=message,
+            reason=f"Автоматическая модерация (LLM) -> {reason_llm}",
+        ))
 
-        await context.bot.restrict_chat_member(
+        await self.actions.run(
+            ActionPriority.PUNITIVE, chat_id, context.bot.restrict_chat_member,
             chat_id=chat_id,
             user_id=user_id,
             permissions=ChatPermissions(can_send_messages=False),
             until_date=until_date,
         )
+        if self.moderation is not None:
+            self.moderation.set_muted_until(chat_id, user_id, until_date)
+        self._schedule_end(chat_id, user_id, until_date)
+
+    def _schedule_end(self, chat_id: int, user_id: int, until_date: datetime | None) -> None:
+        """Remember when a timed mute ends; a permanent mute or an unmute drops the pending end."""
+        if self.timers is None:
+            return
+        if until_date is not None:
+            self.timers.schedule(TimerKind.UNMUTE, chat_id, user_id, until_date.timestamp())
+        else:
+            self.timers.cancel(TimerKind.UNMUTE, chat_id, user_id)
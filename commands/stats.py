@@ -0,0 +1,38 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from services import ConsoleLog, ActionScheduler, ActionPriority, PreFilter, VerdictCache, TimerScheduler, \
+    metrics
+from .utils import is_admin
+from handlers.error import UserIsAdminError
+
+
+class Stats:
+    def __init__(self, console_log: ConsoleLog, action_scheduler: ActionScheduler, prefilter: PreFilter,
+                 verdict_cache: VerdictCache | None = None, timers: TimerScheduler | None = None) -> None:
+        self.console_logs = console_log.with_name(__name__)
+        self.actions = action_scheduler
+        self.prefilter = prefilter
+        self.verdict_cache = verdict_cache
+        self.timers = timers
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not await is_admin(update):
+            raise UserIsAdminError("Команда доступна только администраторам.")
+
+        sections = {
+            "Префильтр": self.prefilter.stats(),
+            "Кэш вердиктов": self.verdict_cache.stats() if self.verdict_cache is not None else {},
+            "Очередь Telegram": self.actions.stats(),
+            "Таймеры": self.timers.stats() if self.timers is not None else {},
+        }
+        lines = []
+        for title, stats in sections.items():
+            if stats:
+                lines.append(f"{title}: " + ", ".join(
+                    f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in stats.items()))
+        if metrics.enabled:
+            lines.extend(metrics.summary())
+        await self.actions.run(ActionPriority.NOTIFY, update.effective_chat.id, context.bot.send_message,
+                               update.effective_chat.id, "\n".join(lines)[:4096])
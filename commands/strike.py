@@ -4,7 +4,7 @@ from typing import Self
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from services import ConsoleLog, FirebaseClient
+from services import ConsoleLog, ModerationStore
 from .utils import is_admin
 from handlers.error import UserIsAdminError, UserNotRepliedError
 
@@ -14,9 +14,9 @@ class Additions(Enum):
     RESET = "RESET"
 
 class Strike:
-    def __init__(self, console_log: ConsoleLog, firebase_db: FirebaseClient) -> None:
+    def __init__(self, console_log: ConsoleLog, moderation_store: ModerationStore) -> None:
         self.console_logs = console_log.with_name(__name__)
-        self.firebase_db = firebase_db
+        self.moderation = moderation_store
         self.adds: set[Additions] = set()
 
     def get(self) -> Self:
@@ -34,7 +34,7 @@ class Strike:
         return self
 
     async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        if not is_admin(update):
+        if not await is_admin(update):
             raise UserIsAdminError("Команда доступна только администраторам.")
 
         try:
@@ -42,10 +42,9 @@ class Strike:
             user = update.message.reply_to_message.from_user
         except AttributeError:
             raise UserNotRepliedError("Не указан пользователь — Необходимо ответить на сообщение пользователя")
-        print(user.id)
         if Additions.GET in self.adds:
-            strike_count = await self.firebase_db.read(f"moderation/{msg.chat_id}/{user.id}/strikes")
+            strike_count = self.moderation.get_strikes(msg.chat_id, user.id)
             await context.bot.send_message(msg.chat_id, f"Предупреждений пользователя {user.full_name} сейчас: {strike_count}")
         elif Additions.RESET in self.adds:
-            await self.firebase_db.update(f"moderation/{msg.chat_id}/{user.id}", {"strikes": 0})
+            self.moderation.set_strikes(msg.chat_id, user.id, 0)
             await context.bot.send_message(msg.chat_id, f"Предупреждения пользователя {user.full_name} сброшены")
@@ -1,7 +1,10 @@
-from telegram import Update
+from telegram import Update, Chat, ChatMember, ChatMemberUpdated
 
 from handlers.error import InvalidDurationFormatError
+from services.metrics import metrics
+import asyncio
 import re
+from time import monotonic
 
 def parse_duration(s: str):
     match = re.match(r"(\d+)([mhd])", s)
@@ -16,8 +19,57 @@ def parse_duration(s: str):
         "d": value * 86400
     }[unit]
 
-async def is_admin(update: Update):
+class AdminCache:
+    """
+    Per-chat roster of administrators filled from get_chat_administrators.
+    Rosters expire after ttl seconds and are patched by chat member updates.
+    """
+
+    ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+    def __init__(self, ttl: float = 600) -> None:
+        self.ttl = ttl
+        self._rosters: dict[int, tuple[float, set[int]]] = {}
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    async def admins(self, chat: Chat) -> set[int]:
+        """Ids of the chat administrators, fetched at most once per ttl."""
+        roster = self._rosters.get(chat.id)
+        if roster is not None and monotonic() - roster[0] < self.ttl:
+            return roster[1]
+
+        task = self._inflight.get(chat.id)
+        if task is None:
+            task = asyncio.create_task(chat.get_administrators())
+            self._inflight[chat.id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(chat.id, None))
+        members = await asyncio.shield(task)
+        admins = {member.user.id for member in members}
+        self._rosters[chat.id] = (monotonic(), admins)
+        return admins
+
+    async def is_admin(self, chat: Chat, user_id: int) -> bool:
+        with metrics.track("is_admin"):
+            return user_id in await self.admins(chat)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._rosters.pop(chat_id, None)
+
+    def member_updated(self, chat_member: ChatMemberUpdated) -> None:
+        """Apply a chat_member update to the cached roster of its chat."""
+        roster = self._rosters.get(chat_member.chat.id)
+        if roster is None:
+            return
+        user_id = chat_member.new_chat_member.user.id
+        if chat_member.new_chat_member.status in self.ADMIN_STATUSES:
+            roster[1].add(user_id)
+        else:
+            roster[1].discard(user_id)
+
+
+admin_cache = AdminCache()
+
+
+async def is_admin(update: Update, cache: AdminCache = admin_cache) -> bool:
     """Check if the user that sent the message is an admin in the chat."""
-    user_id = update.effective_user.id
-    member = await update.effective_chat.get_member(user_id)
-    return member.status in ['administrator', 'creator']
\ No newline at end of file
+    return await cache.is_admin(update.effective_chat, update.effective_user.id)
\ No newline at end of file
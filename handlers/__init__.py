@@ -1,7 +1,9 @@
 from .admin import Admin
 from .auth import Auth
+from .expiry import Expiry
 
 __all__ = [
     'Admin',
-    'Auth'
+    'Auth',
+    'Expiry',
 ]
@@ -1,44 +1,83 @@
-from telegram.ext import CommandHandler, filters
+from telegram import Update
+from telegram.ext import CommandHandler, ChatMemberHandler, ContextTypes, filters
 
-from services import ConsoleLog, FirebaseLog, FirebaseClient
+from services import ConsoleLog, FirebaseLog, FirebaseClient, ModerationStore, PreFilter, ActionScheduler, VerdictCache, \
+    TimerScheduler
 
 
 class Admin:
-    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog, firebase_client: FirebaseClient) -> None:
+    def __init__(self, firebase_log: FirebaseLog, console_log: ConsoleLog, firebase_client: FirebaseClient,
+                 moderation_store: ModerationStore, prefilter: PreFilter, action_scheduler: ActionScheduler,
+                 verdict_cache: VerdictCache | None = None, timers: TimerScheduler | None = None) -> None:
         self.firebase_logs = firebase_log
         self.console_logs = console_log.with_name(__name__)
         self.command_filter = ~filters.ChatType.PRIVATE & filters.COMMAND
         self.firebase_db = firebase_client
+        self.moderation = moderation_store
+        self.prefilter = prefilter
+        self.actions = action_scheduler
+        self.verdict_cache = verdict_cache
+        self.timers = timers
+        self._commands: dict[tuple, object] = {}
 
     def handlers(self) -> list:
-        from commands import Mute, Ban, Kick, Strike
+        from commands import Mute, Ban, Kick, Strike, Lexicon, Stats, ModLog
+        kick = lambda *modifiers: self._shared(Kick, modifiers, console_log=self.console_logs, action_scheduler=self.actions)
+        ban = lambda *modifiers: self._shared(Ban, modifiers, firebase_log=self.firebase_logs, console_log=self.console_logs, action_scheduler=self.actions, timers=self.timers)
+        mute = lambda *modifiers: self._shared(Mute, modifiers, firebase_log=self.firebase_logs, console_log=self.console_logs, action_scheduler=self.actions, timers=self.timers)
+        strike = lambda *modifiers: self._shared(Strike, modifiers, console_log=self.console_logs, moderation_store=self.moderation)
+        lexicon = lambda *modifiers: self._shared(Lexicon, modifiers, console_log=self.console_logs, firebase_db=self.firebase_db, prefilter=self.prefilter)
         return [
-            CommandHandler("kick", Kick(console_log=self.console_logs), filters=~filters.ChatType.PRIVATE & filters.COMMAND),
-            CommandHandler("dkick", Kick(console_log=self.console_logs).with_delete(), filters=~filters.ChatType.PRIVATE & filters.COMMAND),
-            CommandHandler("skick", Kick(console_log=self.console_logs).with_silent(), filters=~filters.ChatType.PRIVATE & filters.COMMAND),
-            CommandHandler(["sdkick", 'dskick'], Kick(console_log=self.console_logs).with_silent().with_delete(), filters=~filters.ChatType.PRIVATE & filters.COMMAND),
-
-            CommandHandler("ban", Ban(firebase_log=self.firebase_logs, console_log=self.console_logs), filters=self.command_filter),
-            CommandHandler("dban", Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_delete(), filters=self.command_filter),
-            CommandHandler("sban", Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_silent(), filters=self.command_filter),
-            CommandHandler("tban", Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer(), filters=self.command_filter),
-            CommandHandler(["sdban", "dsban"], Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_delete().with_silent(), filters=self.command_filter),
-            CommandHandler(["tdban", "dtban"], Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete(), filters=self.command_filter),
-            CommandHandler(["tsban", "stban"], Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete(), filters=self.command_filter),
-            CommandHandler(["tsdban", "tdsdban", "stdban", "sdtban", "dtsban", "dstban"], Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete().with_silent(), filters=self.command_filter),
-            CommandHandler("unban", Ban(firebase_log=self.firebase_logs, console_log=self.console_logs).with_invert(), filters=self.command_filter),
-
-            CommandHandler("mute", Mute(firebase_log=self.firebase_logs, console_log=self.console_logs), filters=self.command_filter),
-            CommandHandler("dmute", Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_delete(), filters=self.command_filter),
-            CommandHandler("smute", Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_silent(), filters=self.command_filter),
-            CommandHandler("tmute", Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer(), filters=self.command_filter),
-            CommandHandler(["sdmute", "dsmute"], Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_delete().with_silent(), filters=self.command_filter),
-            CommandHandler(["tdmute", "dtmute"], Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete(), filters=self.command_filter),
-            CommandHandler(["tsmute", "stmute"], Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete(), filters=self.command_filter),
-            CommandHandler(["tsdmute", "tdsdmute", "stdmute", "sdtmute", "dtsmute", "dstmute"], Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_timer().with_delete().with_silent(), filters=self.command_filter),
-            CommandHandler("unmute", Mute(firebase_log=self.firebase_logs, console_log=self.console_logs).with_invert(), filters=self.command_filter),
-
-            CommandHandler("strike", Strike(console_log=self.console_logs, firebase_db=self.firebase_db).get(), filters=self.command_filter),
-            CommandHandler("rstrike", Strike(console_log=self.console_logs, firebase_db=self.firebase_db).reset(), filters=self.command_filter),
+            ChatMemberHandler(self.chat_member_updated, ChatMemberHandler.CHAT_MEMBER),
+
+            CommandHandler("kick", kick(), filters=self.command_filter),
+            CommandHandler("dkick", kick("with_delete"), filters=self.command_filter),
+            CommandHandler("skick", kick("with_silent"), filters=self.command_filter),
+            CommandHandler(["sdkick", 'dskick'], kick("with_silent", "with_delete"), filters=self.command_filter),
+
+            CommandHandler("ban", ban(), filters=self.command_filter),
+            CommandHandler("dban", ban("with_delete"), filters=self.command_filter),
+            CommandHandler("sban", ban("with_silent"), filters=self.command_filter),
+            CommandHandler("tban", ban("with_timer"), filters=self.command_filter),
+            CommandHandler(["sdban", "dsban"], ban("with_delete", "with_silent"), filters=self.command_filter),
+            CommandHandler(["tdban", "dtban"], ban("with_timer", "with_delete"), filters=self.command_filter),
+            CommandHandler(["tsban", "stban"], ban("with_timer", "with_delete"), filters=self.command_filter),
+            CommandHandler(["tsdban", "tdsdban", "stdban", "sdtban", "dtsban", "dstban"], ban("with_timer", "with_delete", "with_silent"), filters=self.command_filter),
+            CommandHandler("unban", ban("with_invert"), filters=self.command_filter),
+
+            CommandHandler("mute", mute(), filters=self.command_filter),
+            CommandHandler("dmute", mute("with_delete"), filters=self.command_filter),
+            CommandHandler("smute", mute("with_silent"), filters=self.command_filter),
+            CommandHandler("tmute", mute("with_timer"), filters=self.command_filter),
+            CommandHandler(["sdmute", "dsmute"], mute("with_delete", "with_silent"), filters=self.command_filter),
+            CommandHandler(["tdmute", "dtmute"], mute("with_timer", "with_delete"), filters=self.command_filter),
+            CommandHandler(["tsmute", "stmute"], mute("with_timer", "with_delete"), filters=self.command_filter),
+            CommandHandler(["tsdmute", "tdsdmute", "stdmute", "sdtmute", "dtsmute", "dstmute"], mute("with_timer", "with_delete", "with_silent"), filters=self.command_filter),
+            CommandHandler("unmute", mute("with_invert"), filters=self.command_filter),
+
+            CommandHandler("strike", strike("get"), filters=self.command_filter),
+            CommandHandler("rstrike", strike("reset"), filters=self.command_filter),
+
+            CommandHandler("blockword", lexicon("block"), filters=self.command_filter),
+            CommandHandler("allowword", lexicon("allow"), filters=self.command_filter),
+            CommandHandler("delword", lexicon("remove"), filters=self.command_filter),
+
+            CommandHandler("modlog", ModLog(console_log=self.console_logs, firebase_client=self.firebase_db, action_scheduler=self.actions), filters=self.command_filter),
+            CommandHandler("stats", Stats(console_log=self.console_logs, action_scheduler=self.actions, prefilter=self.prefilter, verdict_cache=self.verdict_cache, timers=self.timers), filters=self.command_filter),
         ]
 
+    def _shared(self, command: type, modifiers: tuple[str, ...], **kwargs):
+        """One instance per command class and set of modifiers, shared by all its aliases."""
+        key = (command, frozenset(modifiers))
+        instance = self._commands.get(key)
+        if instance is None:
+            instance = command(**kwargs)
+            for modifier in modifiers:
+                getattr(instance, modifier)()
+            self._commands[key] = instance
+        return instance
+
+    async def chat_member_updated(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Keep the cached admin roster in sync with promotions and demotions."""
+        from commands.utils import admin_cache
+        admin_cache.member_updated(update.chat_member)
@@ -1,13 +1,44 @@
-from telegram import Update, ChatPermissions
+import asyncio
+from collections import deque
+from time import monotonic
+
+from telegram import Bot, Update, ChatPermissions
 from telegram.ext import ContextTypes
 
 from telegram.ext import filters, MessageHandler
 
 from services.firebase import FirebaseClient
+from services.outbound import ActionScheduler, ActionPriority
+from services.verified import VerifiedUsers
 
 class Auth:
-    def __init__(self, firebase_client: FirebaseClient):
+    VERIFY_LINK = "<a href='https://t.me/@t_ad_manager_bot?start'>нажми сюда</a>"
+    MENTIONS_PER_GREETING = 50
+
+    def __init__(self, firebase_client: FirebaseClient, action_scheduler: ActionScheduler,
+                 greeting_window: float = 5.0, restrict_concurrency: int = 8, raid_joins: int = 30,
+                 raid_window: float = 60.0, raid_cooldown: float = 600.0,
+                 verified_users: VerifiedUsers | None = None):
+        """
+        verified_users: local index answering "has the user verified" without reading users/{id}.
+        greeting_window: seconds during which greetings of new members are merged into one message.
+        restrict_concurrency: restrictions of new members in flight at the same time.
+        raid_joins: joins within raid_window seconds that switch the chat into raid mode for raid_cooldown
+                    seconds; in raid mode every new member is restricted until verified and nobody is greeted.
+        """
         self.firebase_db = firebase_client
+        self.actions = action_scheduler
+        self.verified_users = verified_users
+        self.greeting_window = greeting_window
+        self.raid_joins = raid_joins
+        self.raid_window = raid_window
+        self.raid_cooldown = raid_cooldown
+        self._restrict_slots = asyncio.Semaphore(restrict_concurrency)
+        self._joins: dict[int, deque[float]] = {}
+        self._raid_until: dict[int, float] = {}
+        self._greetings: dict[int, list[str]] = {}
+        self._greeting_timers: dict[int, tuple[asyncio.TimerHandle, Bot]] = {}
+        self._greeting_tasks: set[asyncio.Task] = set()
 
     def handlers(self) -> list:
         return [
@@ -16,22 +47,99 @@ class Auth:
         ]
 
     async def user_entered_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Authorize user that entered the group"""
-        for member in update.message.new_chat_members:
-            user_id = member.id
-            chat_id = update.message.chat.id
-            if await self.firebase_db.read(f'users/{user_id}') is None:
-                await self.firebase_db.update(f'users_unavailable_chats/{user_id}', {chat_id: user_id})
-                await context.bot.restrict_chat_member(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    permissions=ChatPermissions.no_permissions()
-                )
-                await context.bot.send_message(chat_id=update.message.chat_id,
-                                               text=(
-                                                   f"Привет, @{member.username}, чтобы писать в группу, "
-                                                   f"<a href='https://t.me/@t_ad_manager_bot?start'>нажми сюда</a>."
-                                               ), parse_mode="HTML")
+        """Authorize users that entered the group"""
+        chat_id = update.message.chat.id
+        members = update.message.new_chat_members
+        raid_started, raid = self._track_joins(chat_id, len(members))
+
+        unverified = list(members) if raid else await self._unverified(members)
+        if not unverified:
+            return
+
+        await self.firebase_db.update("/", {
+            f'users_unavailable_chats/{member.id}/{chat_id}': member.id for member in unverified})
+        await asyncio.gather(*(self._restrict(context, chat_id, member.id) for member in unverified))
+
+        if raid_started:
+            await self.actions.run(ActionPriority.NOTIFY, chat_id, context.bot.send_message,
+                                   chat_id=chat_id,
+                                   text=(f"Слишком много новых участников – включён режим защиты от рейда. "
+                                         f"Чтобы писать в группу, {self.VERIFY_LINK}."),
+                                   parse_mode="HTML")
+        elif not raid:
+            await self._greet(context.bot, chat_id, unverified)
+
+    async def close(self) -> None:
+        """Send the greetings still waiting for their window to end."""
+        for chat_id, (timer, bot) in list(self._greeting_timers.items()):
+            timer.cancel()
+            self._greeting_window_ended(bot, chat_id)
+        await asyncio.gather(*self._greeting_tasks, return_exceptions=True)
+
+    async def _unverified(self, members: list) -> list:
+        """Members that never wrote to the bot privately."""
+        if self.verified_users is not None:
+            members = [member for member in members if member.id not in self.verified_users]
+            if not members or self.verified_users.authoritative:
+                return members
+        # No index, or the user may have verified in another shard: confirm in Firebase.
+        verified = await self.firebase_db.read_many([f'users/{member.id}' for member in members])
+        unverified = []
+        for member in members:
+            if verified[f'users/{member.id}'] is None:
+                unverified.append(member)
+            elif self.verified_users is not None:
+                self.verified_users.add(member.id)
+        return unverified
+
+    async def _restrict(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> None:
+        async with self._restrict_slots:
+            await self.actions.run(
+                ActionPriority.PUNITIVE, chat_id, context.bot.restrict_chat_member,
+                chat_id=chat_id,
+                user_id=user_id,
+                permissions=ChatPermissions.no_permissions()
+            )
+
+    def _track_joins(self, chat_id: int, count: int) -> tuple[bool, bool]:
+        """Record the joins and return (raid mode started now, chat is in raid mode)."""
+        now = monotonic()
+        if self._raid_until.get(chat_id, 0) > now:
+            return False, True
+        joins = self._joins.get(chat_id)
+        if joins is None:
+            joins = self._joins[chat_id] = deque(maxlen=self.raid_joins)
+        joins.extend([now] * count)
+        if len(joins) == joins.maxlen and now - joins[0] <= self.raid_window:
+            self._raid_until[chat_id] = now + self.raid_cooldown
+            joins.clear()
+            return True, True
+        return False, False
+
+    async def _greet(self, bot: Bot, chat_id: int, members: list) -> None:
+        pending = self._greetings.setdefault(chat_id, [])
+        pending.extend(f"@{member.username}" if member.username else member.mention_html() for member in members)
+        if self.greeting_window <= 0:
+            await self._send_greetings(bot, chat_id)
+        elif chat_id not in self._greeting_timers:
+            timer = asyncio.get_running_loop().call_later(self.greeting_window, self._greeting_window_ended, bot, chat_id)
+            self._greeting_timers[chat_id] = (timer, bot)
+
+    def _greeting_window_ended(self, bot: Bot, chat_id: int) -> None:
+        self._greeting_timers.pop(chat_id, None)
+        task = asyncio.create_task(self._send_greetings(bot, chat_id))
+        self._greeting_tasks.add(task)
+        task.add_done_callback(self._greeting_tasks.discard)
+
+    async def _send_greetings(self, bot: Bot, chat_id: int) -> None:
+        mentions = self._greetings.pop(chat_id, [])
+        for i in range(0, len(mentions), self.MENTIONS_PER_GREETING):
+            await self.actions.run(ActionPriority.NOTIFY, chat_id, bot.send_message,
+                                   chat_id=chat_id,
+                                   text=(
+                                       f"Привет, {', '.join(mentions[i:i + self.MENTIONS_PER_GREETING])}, "
+                                       f"чтобы писать в группу, {self.VERIFY_LINK}."
+                                   ), parse_mode="HTML")
 
     async def verify_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user = update.effective_user
@@ -42,16 +150,22 @@ class Auth:
         username = user.username
 
         await self.firebase_db.write(f'users/{user_id}', {username: user_id})
+        if self.verified_users is not None:
+            self.verified_users.add(user_id)
 
         chats = await self.firebase_db.read(f'users_unavailable_chats/{user_id}')
         if chats:
-            for chat_id in chats.values():
-                await context.bot.restrict_chat_member(
+            await asyncio.gather(*(
+                self.actions.run(
+                    ActionPriority.PUNITIVE, chat_id, context.bot.restrict_chat_member,
                     chat_id=chat_id,
                     user_id=user_id,
                     permissions=ChatPermissions.all_permissions()
                 )
+                for chat_id in chats.values()
+            ))
             await self.firebase_db.delete(f'users_unavailable_chats/{user_id}')
-        await update.message.reply_text(
+        await self.actions.run(
+            ActionPriority.NOTIFY, update.effective_chat.id, update.message.reply_text,
             "Спасибо, что написали мне! Теперь вы можете писать в группе."
         )
\ No newline at end of file
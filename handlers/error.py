@@ -14,4 +14,7 @@ class MissingDurationError(BaseError):
     """Ошибка, если не указано время для временного бана."""
 
 class UserIsAdminError(BaseError):
-    """Ошибка, если пользователь является администратором."""
\ No newline at end of file
+    """Ошибка, если пользователь является администратором."""
+
+class MissingWordError(BaseError):
+    """Ошибка, если не указано слово для списка слов чата."""
@@ -0,0 +1,68 @@
+import logging
+from time import time
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+from services.log import ConsoleLog, FirebaseLog, FirebaseAction, FirebaseLogFormat
+from services.moderation import ModerationStore
+from services.outbound import ActionScheduler, ActionPriority
+from services.timers import TimerScheduler, TimerKind
+
+
+class Expiry:
+    """
+    Ends of timed punishments and strike decay, driven by the persistent timers.
+    Telegram lifts a mute or ban by itself at until_date; here the bot keeps moderation/
+    and logs/ in sync with it and tells the user.
+    """
+
+    def __init__(self, timers: TimerScheduler, firebase_log: FirebaseLog, console_log: ConsoleLog,
+                 moderation_store: ModerationStore, action_scheduler: ActionScheduler,
+                 strike_ttl: float = 7 * 24 * 3600) -> None:
+        """strike_ttl: seconds without new strikes after which one strike is taken off (0 – strikes never decay)."""
+        self.timers = timers
+        self.firebase_logs = firebase_log
+        self.console_logs = console_log.with_name(__name__)
+        self.moderation = moderation_store
+        self.actions = action_scheduler
+        self.strike_ttl = strike_ttl
+        self.bot: Bot | None = None
+
+    def start(self, bot: Bot) -> None:
+        """Register the timer handlers; bot sends the notifications."""
+        self.bot = bot
+        self.timers.on(TimerKind.STRIKE_DECAY, self.strike_decayed)
+        self.timers.on(TimerKind.UNMUTE, self.unmuted)
+        self.timers.on(TimerKind.UNBAN, self.unbanned)
+
+    def strike_added(self, chat_id: int, user_id: int) -> None:
+        """(Re)start the decay countdown of the user's strikes."""
+        if self.strike_ttl > 0:
+            self.timers.schedule(TimerKind.STRIKE_DECAY, chat_id, user_id, time() + self.strike_ttl)
+
+    async def strike_decayed(self, chat_id: int, user_id: int) -> None:
+        strikes = await self.moderation.decay_strike(chat_id, user_id)
+        if strikes > 0:
+            self.strike_added(chat_id, user_id)
+        await self.console_logs.awrite(status=logging.INFO, msg=f"Strike decayed, {strikes} left",
+                                       chat_id=chat_id, user_id=user_id, sampled=True)
+
+    async def unmuted(self, chat_id: int, user_id: int) -> None:
+        self.moderation.set_muted_until(chat_id, user_id, None)
+        await self.firebase_logs.awrite(FirebaseAction.UNMUTE, FirebaseLogFormat(
+            chat_id=chat_id, user_id=user_id, message="", reason="Срок мута истёк"))
+        await self._notify(user_id, "Срок мута истёк, вы снова можете писать в чат.")
+
+    async def unbanned(self, chat_id: int, user_id: int) -> None:
+        await self.firebase_logs.awrite(FirebaseAction.UNBAN, FirebaseLogFormat(
+            chat_id=chat_id, user_id=user_id, message="", reason="Срок бана истёк"))
+        await self._notify(user_id, "Срок бана истёк, вы можете вернуться в чат.")
+
+    async def _notify(self, user_id: int, text: str) -> None:
+        if self.bot is None:
+            return
+        try:
+            await self.actions.run(ActionPriority.NOTIFY, user_id, self.bot.send_message, user_id, text)
+        except TelegramError:
+            pass  # the user never started a private chat with the bot
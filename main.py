@@ -1,36 +1,192 @@
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 
-from telegram import Update
+from telegram import Bot as TelegramBot
 from telegram.ext import Application
 
-from bot import Bot
-from services import LLMService, ConsoleLog, FirebaseLog, FirebaseClient
+from bot import Bot, ChatOrderedUpdateProcessor, ConcurrencyLimiter, allowed_updates, serve_webhook, run_sharded, \
+    shard_of
+from services import LLMService, ConsoleLog, BufferedFirebaseLog, FirebaseClient, FirebaseBackend, ModerationStore, \
+    VerdictCache, PreFilter, FloodIndex, FloodAction, ActionScheduler, MetricsServer, metrics, VerifiedUsers, \
+    TimerScheduler, ChatContext, FallbackPolicy
 
 
-def main() -> None:
+def shard_path(path: str | None, shard: int, shards: int) -> str | None:
+    """Every shard keeps its own SQLite files: the shard number goes before the suffix of path."""
+    if not path or shards == 1:
+        return path
+    stem, dot, suffix = path.rpartition(".")
+    return f"{stem}.{shard}.{suffix}" if dot else f"{path}.{shard}"
+
+
+def build_bot(shard: int = 0, shards: int = 1, front: bool = False) -> Bot:
+    """
+    Build the bot and its services; with shards > 1 it serves only the chats of the given shard.
+    front: only the handlers are needed (the front of the shards routes updates by them), so no
+    file, model, SDK client or Firebase app is opened.
+    """
     load_dotenv()
 
-    console_log = ConsoleLog("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    console_log = ConsoleLog("%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                             structured=os.getenv("LOG_FORMAT", "text").lower() == "json",
+                             queued=os.getenv("LOG_QUEUE", "1") == "1",
+                             sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.1")))
     console_log.set_name("httpx").set_level(logging.WARNING)
     console_log.set_name(__name__)
 
-    firebase_client = FirebaseClient(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"))
-    firebase_log = FirebaseLog(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"))
+    # Defer the Firebase app and the LLM SDK import until first use (or a background warm-up).
+    lazy = front or os.getenv("FAST_START", "0") == "1"
+
+    firebase_backend = FirebaseBackend(os.getenv("FIREBASE_BACKEND", FirebaseBackend.EXECUTOR.value).upper())
+    firebase_client = FirebaseClient(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"),
+                                     backend=firebase_backend, lazy=lazy)
+    firebase_log = BufferedFirebaseLog(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"),
+                                       backend=firebase_backend, lazy=lazy,
+                                       flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "0.5")))
+
+    moderation_store = ModerationStore(firebase_client=firebase_client,
+                                       snapshot_interval=float(os.getenv("MODERATION_SNAPSHOT_INTERVAL", "5")))
+
+    verdict_cache = VerdictCache(maxsize=int(os.getenv("VERDICT_CACHE_SIZE", "4096")),
+                                 ttl=float(os.getenv("VERDICT_CACHE_TTL", "3600")),
+                                 path=None if front else shard_path(os.getenv("VERDICT_CACHE_PATH"), shard, shards))
+    local_classifier = None
+    if os.getenv("LOCAL_CLASSIFIER") and not front:
+        # Imported here: NumPy is loaded only when the local classifier is configured.
+        from services import LocalClassifier
+        local_classifier = LocalClassifier.load(os.getenv("LOCAL_CLASSIFIER"),
+                                                unsafe_above=float(os.getenv("LOCAL_UNSAFE_ABOVE", "0.9")),
+                                                safe_below=float(os.getenv("LOCAL_SAFE_BELOW", "0.2")))
+    llm_service = LLMService(console_log=console_log, verdict_cache=verdict_cache,
+                             batch_size=int(os.getenv("LLM_BATCH_SIZE", "1")),
+                             batch_delay=float(os.getenv("LLM_BATCH_DELAY", "0.05")),
+                             lazy=lazy,
+                             models=[model.strip() for model in os.getenv("LLM_MODELS", "").split(",") if model.strip()],
+                             tier_timeout=float(os.getenv("LLM_TIER_TIMEOUT", "2")),
+                             latency_budget=float(os.getenv("LLM_LATENCY_BUDGET", "10")) or None,
+                             fallback=FallbackPolicy(os.getenv("LLM_FALLBACK", FallbackPolicy.SAFE.value).upper()),
+                             stream=os.getenv("LLM_STREAM", "0") == "1",
+                             reason_tokens=int(os.getenv("LLM_REASON_TOKENS", "64")),
+                             backend=local_classifier,
+                             remote=os.getenv("LOCAL_ONLY", "0") != "1")
+
+    prefilter = PreFilter(lexicon_path=os.getenv("PREFILTER_LEXICON"),
+                          max_chats=int(os.getenv("PREFILTER_CHATS", "20000")),
+                          idle_ttl=float(os.getenv("PREFILTER_IDLE_TTL", "3600")))
+    flood_index = FloodIndex(window=int(os.getenv("FLOOD_WINDOW", "200")),
+                             window_seconds=float(os.getenv("FLOOD_WINDOW_SECONDS", "600")),
+                             max_distance=int(os.getenv("FLOOD_MAX_DISTANCE", "8")),
+                             flood_users=int(os.getenv("FLOOD_USERS", "4")))
+
+    context_size = int(os.getenv("CONTEXT_SIZE", "10"))
+    chat_context = ChatContext(size=context_size, max_chats=int(os.getenv("CONTEXT_CHATS", "20000")),
+                               idle_ttl=float(os.getenv("CONTEXT_IDLE_TTL", "3600"))) if context_size > 0 else None
+
+    # The global limit is per bot token: the shards share it. Chats belong to one shard, so their limit does not.
+    action_scheduler = ActionScheduler(global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")) / shards,
+                                       chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", str(20 / 60))),
+                                       chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "20")))
+
+    verified_users = VerifiedUsers(authoritative=shards == 1) \
+        if os.getenv("VERIFIED_INDEX", "1") == "1" else None
 
-    llm_service = LLMService(console_log=console_log)
+    timers = TimerScheduler(path=None if front else shard_path(os.getenv("TIMERS_PATH"), shard, shards),
+                            horizon=float(os.getenv("TIMERS_HORIZON", "3600")))
 
-    app = Application.builder().token(os.getenv("TOKEN")).build()
+    llm_limiter = ConcurrencyLimiter(global_limit=int(os.getenv("LLM_CONCURRENCY", "16")),
+                                     per_chat_limit=int(os.getenv("LLM_CHAT_CONCURRENCY", "2")))
 
-    bot = Bot(llm_service=llm_service, firebase_client=firebase_client, firebase_log=firebase_log, console_log=console_log)
+    return Bot(llm_service=llm_service, firebase_client=firebase_client, firebase_log=firebase_log, console_log=console_log,
+               moderation_store=moderation_store, prefilter=prefilter, llm_limiter=llm_limiter,
+               flood_index=flood_index, action_scheduler=action_scheduler, flood_action=FloodAction(os.getenv("FLOOD_ACTION", FloodAction.MUTE.value).upper()),
+               greeting_window=float(os.getenv("GREETING_WINDOW", "5")),
+               raid_joins=int(os.getenv("RAID_JOINS", "30")),
+               raid_window=float(os.getenv("RAID_WINDOW", "60")),
+               raid_cooldown=float(os.getenv("RAID_COOLDOWN", "600")),
+               verified_users=verified_users, timers=timers,
+               strike_ttl=float(os.getenv("STRIKE_TTL", str(7 * 24 * 3600))),
+               chat_context=chat_context, context_tokens=int(os.getenv("CONTEXT_TOKENS", "300")),
+               context_max_length=int(os.getenv("CONTEXT_MAX_LENGTH", "0")))
+
+
+def build_application(shard: int = 0, shards: int = 1) -> Application:
+    """Build the bot application; with shards > 1 it serves only the chats of the given shard."""
+    bot = build_bot(shard, shards)
+    fast_start = os.getenv("FAST_START", "0") == "1"
+
+    metrics_port = os.getenv("METRICS_PORT")
+    metrics_server = MetricsServer(host=os.getenv("METRICS_HOST", "127.0.0.1"), port=int(metrics_port) + shard) \
+        if metrics_port else None
+    if metrics_server is not None or os.getenv("METRICS", "0") == "1":
+        metrics.enable()
+
+    async def post_init(application: Application) -> None:
+        if fast_start:
+            application.create_task(bot.llm_service.warm(), name="llm_warm")
+        await bot.moderation.warm(owns_chat=lambda chat_id: shard_of(chat_id, shards) == shard)
+        await bot.prefilter.warm(bot.firebase_db)
+        if bot.verified_users is not None:
+            await bot.verified_users.warm(bot.firebase_db)
+        bot.moderation.start()
+        bot.expiry.start(application.bot)
+        bot.timers.start()
+        if metrics_server is not None:
+            await metrics_server.start()
+
+    async def post_stop(_: Application) -> None:
+        # The bot is still initialized here: pending greetings, expirations and queued calls can be sent.
+        await bot.timers.close()
+        await bot.auth.close()
+        await bot.actions.close()
+
+    async def post_shutdown(_: Application) -> None:
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await bot.moderation.close()
+        await bot.firebase_db.close()
+        await bot.firebase_logs.close()
+        bot.llm_service.verdict_cache.close()
+
+    app_builder = Application.builder().token(os.getenv("TOKEN")).post_init(post_init).post_stop(post_stop) \
+        .post_shutdown(post_shutdown)
+    concurrent_updates = int(os.getenv("CONCURRENT_UPDATES", "256"))
+    if concurrent_updates > 1:
+        app_builder.concurrent_updates(ChatOrderedUpdateProcessor(max_concurrent_updates=concurrent_updates))
+    app = app_builder.build()
 
     app.add_error_handler(bot.error_handler)
 
     for handler in bot.handlers():
         app.add_handler(handler)
+    return app
+
 
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+def main() -> None:
+    load_dotenv()
+    shards = int(os.getenv("SHARDS", "1"))
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if shards > 1:
+        # The front only polls and routes: it needs the handler list, not the services of a shard.
+        handlers = build_bot(shards=shards, front=True).handlers()
+        asyncio.run(run_sharded(TelegramBot(os.getenv("TOKEN")), build_application, shards, allowed_updates(handlers),
+                                in_process=os.getenv("SHARDS_IN_PROCESS", "0") == "1"))
+        return
+    app = build_application()
+    handlers = [handler for group in app.handlers.values() for handler in group]
+    if webhook_url:
+        webhook_secret = os.getenv("WEBHOOK_SECRET")
+        if not webhook_secret:
+            # Without it every request would be rejected and Telegram would retry the updates forever.
+            raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_URL is set")
+        asyncio.run(serve_webhook(app, url=webhook_url, secret_token=webhook_secret,
+                                  path=os.getenv("WEBHOOK_PATH", "/telegram"),
+                                  host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+                                  port=int(os.getenv("WEBHOOK_PORT", "8080")),
+                                  register=os.getenv("WEBHOOK_REGISTER", "1") == "1"))
+    else:
+        app.run_polling(allowed_updates=allowed_updates(handlers))
 
 
 if __name__ == "__main__":
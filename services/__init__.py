@@ -1,5 +1,28 @@
-from .llm import LLMService
-from .log import (Log, ConsoleLog, FirebaseLog)
-from .firebase import FirebaseClient
+import importlib
 
-__all__ = ["Log", "ConsoleLog", "FirebaseLog", "LLMService", "FirebaseClient"]
+from .llm import LLMService, FallbackPolicy, ModerationBackend
+from .cache import VerdictCache
+from .log import (Log, ConsoleLog, FirebaseLog, BufferedFirebaseLog)
+from .firebase import FirebaseClient, FirebaseBackend
+from .moderation import ModerationStore
+from .prefilter import PreFilter
+from .flood import FloodIndex, FloodAction
+from .outbound import ActionScheduler, ActionPriority
+from .metrics import Metrics, MetricsServer, metrics
+from .verified import VerifiedUsers
+from .timers import TimerScheduler, TimerKind
+from .context import ChatContext
+
+__all__ = ["Log", "ConsoleLog", "FirebaseLog", "BufferedFirebaseLog", "LLMService", "FallbackPolicy", "ModerationBackend", "LocalClassifier", "FirebaseClient", "FirebaseBackend", "ModerationStore", "VerdictCache", "PreFilter", "FloodIndex", "FloodAction", "ActionScheduler", "ActionPriority", "Metrics", "MetricsServer", "metrics", "VerifiedUsers", "TimerScheduler", "TimerKind", "ChatContext"]
+
+
+# Imported on first access (PEP 562): NumPy is only loaded when the local classifier is used.
+_LAZY_EXPORTS = {"LocalClassifier": ".classifier"}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Awaitable, Callable
+
+
+class VerdictCache:
+    """
+    TTL + LRU cache of moderation verdicts keyed on a normalized message fingerprint.
+    Concurrent lookups of the same fingerprint share one computation (single flight).
+    With a path, verdicts are also kept in a local SQLite file and survive restarts. The file is
+    only touched by one worker thread, off the event loop: reads on a memory miss, and writes
+    committed in batches (every commit_every verdicts or commit_interval seconds).
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600.0, path: str | None = None,
+                 commit_every: int = 256, commit_interval: float = 1.0) -> None:
+        """
+        maxsize: verdicts kept in memory, least recently used are evicted first.
+        ttl: seconds a verdict stays valid.
+        path: optional SQLite file backing the cache.
+        commit_every / commit_interval: new verdicts are written to the file in one transaction
+                                        when this many are waiting, or this many seconds after the first.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, tuple[str, str]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._writes: list[tuple] = []
+        self._flush_scheduled = False
+        self._executor: ThreadPoolExecutor | None = None
+        self._disk = None
+        if path:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="verdict-cache")
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts "
+                "(key TEXT PRIMARY KEY, status TEXT, reason TEXT, expires REAL, message TEXT)"
+            )
+            self._disk.execute("DELETE FROM verdicts WHERE expires < ?", (time(),))
+            self._disk.commit()
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Case-, width- and whitespace-insensitive form of the message."""
+        message = unicodedata.normalize("NFKC", message).casefold()
+        return re.sub(r"\s+", " ", message).strip()
+
+    @classmethod
+    def fingerprint(cls, message: str) -> str:
+        return hashlib.blake2b(cls.normalize(message).encode(), digest_size=16).hexdigest()
+
+    async def get_or_compute(self, message: str, compute: Callable[[], Awaitable[tuple[str, str]]],
+                             context: str = "") -> tuple[str, str]:
+        """
+        Cached verdict for the message, computing it with `compute` on a miss.
+        context: what the verdict was also based on (previous messages); it is part of the key.
+        """
+        key = self.fingerprint(f"{context}\x00{message}" if context else message)
+        verdict = self.get(key)
+        if verdict is not None:
+            self.hits += 1
+            return verdict
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            verdict = await self._load(key)
+            if verdict is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                verdict = await compute()
+                self.put(key, verdict, message)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved: waiters re-raise it, nobody else needs to.
+            future.exception()
+            raise
+        else:
+            future.set_result(verdict)
+            return verdict
+        finally:
+            del self._inflight[key]
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        """Verdict kept in memory (the file is read by get_or_compute, off the event loop)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, verdict = entry
+            if expires > time():
+                self._entries.move_to_end(key)
+                return verdict
+            del self._entries[key]
+        return None
+
+    def put(self, key: str, verdict: tuple[str, str], message: str | None = None) -> None:
+        expires = time() + self.ttl
+        self._remember(key, expires, verdict)
+        if self._disk is not None:
+            self._writes.append((key, verdict[0], verdict[1], expires, self.normalize(message) if message else None))
+            if len(self._writes) >= self.commit_every:
+                self._flush()
+            elif not self._flush_scheduled:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    self._flush()
+                else:
+                    self._flush_scheduled = True
+                    loop.call_later(self.commit_interval, self._flush)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """Write the waiting verdicts and close the file."""
+        if self._disk is not None:
+            self._flush()
+            self._executor.shutdown(wait=True)
+            self._disk.close()
+            self._disk = None
+
+    async def _load(self, key: str) -> tuple[str, str] | None:
+        if self._disk is None:
+            return None
+        row = await asyncio.get_running_loop().run_in_executor(self._executor, self._read, key)
+        if row is None:
+            return None
+        verdict = (row[0], row[1])
+        self._remember(key, row[2], verdict)
+        return verdict
+
+    def _read(self, key: str) -> tuple | None:
+        return self._disk.execute(
+            "SELECT status, reason, expires FROM verdicts WHERE key = ? AND expires > ?", (key, time())
+        ).fetchone()
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        if self._disk is None or not self._writes:
+            return
+        rows, self._writes = self._writes, []
+        self._executor.submit(self._write, rows)
+
+    def _write(self, rows: list[tuple]) -> None:
+        self._disk.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)", rows)
+        self._disk.commit()
+
+    def _remember(self, key: str, expires: float, verdict: tuple[str, str]) -> None:
+        self._entries[key] = (expires, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
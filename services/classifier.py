@@ -0,0 +1,117 @@
+import numpy as np
+
+from services.cache import VerdictCache
+
+# Odd multiplier of the rolling n-gram hash (uint64 arithmetic wraps, which is what a hash wants).
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+class LocalClassifier:
+    """
+    Moderation backend running on the CPU: a logistic regression over hashed character n-grams.
+    The n-grams of a message are hashed with array operations, and a batch of queued messages is
+    scored at once (one gather and one reduceat over all their n-grams): about 50 µs per message.
+    Only confident scores become verdicts; the rest (None) are left to the LLM, or count as safe
+    when there is none. The context of a message is not used.
+    """
+
+    def __init__(self, dim: int = 2 ** 18, ngrams: tuple[int, ...] = (2, 3, 4),
+                 unsafe_above: float = 0.9, safe_below: float = 0.2) -> None:
+        """
+        dim: size of the hashed feature space.
+        ngrams: lengths of the character n-grams of the normalized message.
+        unsafe_above: probability of unsafe from which a message is unsafe.
+        safe_below: probability of unsafe under which a message is safe; in between, undecided.
+        """
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.unsafe_above = unsafe_above
+        self.safe_below = safe_below
+        self.weights = np.zeros(dim, dtype=np.float32)
+        self.bias = 0.0
+
+    @classmethod
+    def load(cls, path: str, **thresholds: float) -> "LocalClassifier":
+        """Model saved by save() (tools/train_classifier.py), with optional unsafe_above / safe_below."""
+        with np.load(path) as data:
+            classifier = cls(dim=int(data["dim"]), ngrams=tuple(int(n) for n in data["ngrams"]), **thresholds)
+            classifier.weights = data["weights"].astype(np.float32)
+            classifier.bias = float(data["bias"])
+        return classifier
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, dim=self.dim, ngrams=np.array(self.ngrams))
+
+    async def classify(self, messages: list[tuple[str, str]]) -> list[tuple[str, str] | None]:
+        """(status, reason) of every confidently scored (message, context) pair, None for the others."""
+        verdicts = []
+        for probability in self.probabilities([message for message, _ in messages]):
+            if probability >= self.unsafe_above:
+                verdicts.append(("unsafe", f"Нарушение правил (локальный классификатор, {probability:.0%})"))
+            elif probability < self.safe_below:
+                verdicts.append(("safe", ""))
+            else:
+                verdicts.append(None)
+        return verdicts
+
+    def probabilities(self, texts: list[str]) -> np.ndarray:
+        """Probability of unsafe of every text."""
+        features, offsets, norms = self._vectorize(texts)
+        return self._sigmoid(np.add.reduceat(self.weights[features], offsets) / norms + self.bias)
+
+    def fit(self, texts: list[str], labels: list[int], epochs: int = 20, learning_rate: float = 2.0,
+            l2: float = 1e-6, batch_size: int = 256, seed: int = 0) -> list[float]:
+        """
+        Train on texts labelled 1 (unsafe) or 0 (safe) with mini-batch gradient descent; classes are
+        weighted to count equally. Returns the mean log loss of every epoch.
+        """
+        labels = np.asarray(labels, dtype=np.float32)
+        positives = max(float(labels.sum()), 1.0)
+        negatives = max(len(labels) - positives, 1.0)
+        sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+        rng = np.random.default_rng(seed)
+        losses = []
+        for _ in range(epochs):
+            order = rng.permutation(len(texts))
+            loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                features, offsets, norms = self._vectorize([texts[i] for i in batch])
+                probabilities = self._sigmoid(np.add.reduceat(self.weights[features], offsets) / norms + self.bias)
+                y, w = labels[batch], sample_weights[batch]
+                loss += float(-(w * (y * np.log(probabilities + 1e-7)
+                                     + (1 - y) * np.log(1 - probabilities + 1e-7))).sum())
+                errors = w * (probabilities - y) / len(batch)
+                counts = np.diff(np.append(offsets, len(features)))
+                gradient = np.bincount(features, weights=np.repeat(errors / norms, counts), minlength=self.dim)
+                self.weights -= (learning_rate * (gradient + l2 * self.weights)).astype(np.float32)
+                self.bias -= learning_rate * float(errors.sum())
+            losses.append(loss / len(texts))
+        return losses
+
+    def _vectorize(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Distinct n-gram indices of all the texts end to end, where each text starts, and its L2 norm."""
+        rows = [self._ngrams(text) for text in texts]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.concatenate(rows), offsets, np.sqrt(lengths).astype(np.float32)
+
+    def _ngrams(self, text: str) -> np.ndarray:
+        # Padded with spaces: every text, even an empty one, has at least one n-gram.
+        codes = np.frombuffer(f" {VerdictCache.normalize(text)} ".encode("utf-32-le"), dtype=np.uint32)
+        codes = codes.astype(np.uint64)
+        hashes = []
+        for n in self.ngrams:
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            h = np.full(count, n, dtype=np.uint64)
+            for k in range(n):
+                h = h * _HASH_MULTIPLIER + codes[k:k + count]
+            hashes.append(h)
+        return np.unique(np.concatenate(hashes) % np.uint64(self.dim)).astype(np.intp)
+
+    @staticmethod
+    def _sigmoid(x: np.ndarray) -> np.ndarray:
+        return 1 / (1 + np.exp(-np.clip(x, -30, 30)))
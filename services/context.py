@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from time import monotonic
+
+
+class ContextMessage:
+    """One remembered chat message."""
+    __slots__ = ("message_id", "user_id", "text", "reply_to")
+
+    def __init__(self, message_id: int, user_id: int, text: str, reply_to: int | None) -> None:
+        self.message_id = message_id
+        self.user_id = user_id
+        self.text = text
+        self.reply_to = reply_to
+
+
+class _Ring:
+    """Fixed-size ring of the last messages of a chat: a preallocated list, no per-message reallocation."""
+    __slots__ = ("items", "head", "last_seen")
+
+    def __init__(self, size: int) -> None:
+        self.items: list[ContextMessage | None] = [None] * size
+        self.head = 0
+        self.last_seen = monotonic()
+
+    def append(self, record: ContextMessage) -> None:
+        self.items[self.head] = record
+        self.head = (self.head + 1) % len(self.items)
+        self.last_seen = monotonic()
+
+    def newest_first(self):
+        size = len(self.items)
+        for i in range(1, size + 1):
+            record = self.items[(self.head - i) % size]
+            if record is None:
+                return
+            yield record
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for the budget (about 3 characters per token for Cyrillic text)."""
+    return len(text) // 3 + 1
+
+
+class ChatContext:
+    """
+    The last `size` messages of every active chat, for context-aware moderation.
+    Memory is bounded by max_chats * size * max_text: texts are truncated, chats idle
+    for idle_ttl seconds are evicted, and past max_chats the least recently active chat goes.
+    """
+
+    def __init__(self, size: int = 10, max_chats: int = 20_000, idle_ttl: float = 3600.0,
+                 max_text: int = 300) -> None:
+        """
+        size: messages remembered per chat.
+        max_chats: chats remembered at most.
+        idle_ttl: seconds without messages after which a chat is forgotten.
+        max_text: characters of a message kept.
+        """
+        self.size = size
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.max_text = max_text
+        # Ordered by last activity: idle and least recently active chats are at the front.
+        self._chats: OrderedDict[int, _Ring] = OrderedDict()
+        self.evictions = 0
+
+    def record(self, chat_id: int, message_id: int, user_id: int, text: str, reply_to: int | None = None) -> None:
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            ring = self._chats[chat_id] = _Ring(self.size)
+        else:
+            self._chats.move_to_end(chat_id)
+        ring.append(ContextMessage(message_id, user_id, text[:self.max_text], reply_to))
+        self._evict()
+
+    def window(self, chat_id: int, token_budget: int = 300, reply_to: int | None = None,
+               before: int | None = None) -> list[ContextMessage]:
+        """
+        The most recent messages of the chat that fit in token_budget, oldest first.
+        The message replied to (if still remembered) is taken first, whatever its age.
+        before: only messages older than this message id (the one being checked).
+        """
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            return []
+        records = [record for record in ring.newest_first() if before is None or record.message_id < before]
+        if reply_to is not None:
+            records.sort(key=lambda record: record.message_id != reply_to)
+        window = []
+        for record in records:
+            token_budget -= estimate_tokens(record.text)
+            if token_budget < 0:
+                break
+            window.append(record)
+        window.sort(key=lambda record: record.message_id)
+        return window
+
+    @staticmethod
+    def render(window: list[ContextMessage]) -> str:
+        """One line per message: [user id] text, with the id of the message it answers."""
+        lines = []
+        for record in window:
+            reply = f" (ответ на #{record.reply_to})" if record.reply_to is not None else ""
+            lines.append(f"#{record.message_id} [{record.user_id}]{reply}: {' '.join(record.text.split())}")
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def stats(self) -> dict:
+        return {"chats": len(self._chats), "evictions": self.evictions}
+
+    def _evict(self) -> None:
+        deadline = monotonic() - self.idle_ttl
+        while self._chats:
+            chat_id, ring = next(iter(self._chats.items()))
+            if len(self._chats) <= self.max_chats and ring.last_seen >= deadline:
+                break
+            del self._chats[chat_id]
+            self.evictions += 1
@@ -1,32 +1,276 @@
+import asyncio
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from datetime import timezone
+from time import time
+from typing import Callable
+
 import firebase_admin
-from cryptography.hazmat.primitives.keywrap import aes_key_wrap
 from firebase_admin import credentials, db
+from firebase_admin.exceptions import FirebaseError
+
+from services.metrics import metrics
+
+
+class FirebaseBackend(Enum):
+    """How FirebaseClient talks to the Realtime DB."""
+    BLOCKING = "BLOCKING"
+    EXECUTOR = "EXECUTOR"
+    REST = "REST"
+
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+class PushId:
+    """
+    Firebase push-ID style keys: 8 characters of millisecond time and 12 random characters,
+    in an alphabet ordered like ASCII, so the keys sort by creation time. Keys made within
+    the same millisecond increment the random part and stay ordered too.
+    """
+
+    def __init__(self) -> None:
+        self._last_time = 0
+        self._last_random = [0] * 12
+        self._lock = threading.Lock()
+
+    def __call__(self, timestamp: int | None = None) -> str:
+        """timestamp: milliseconds since the epoch, now by default."""
+        now = int(time() * 1000) if timestamp is None else timestamp
+        with self._lock:
+            if now == self._last_time:
+                for i in range(11, -1, -1):
+                    if self._last_random[i] < 63:
+                        self._last_random[i] += 1
+                        break
+                    self._last_random[i] = 0
+            else:
+                self._last_time = now
+                self._last_random = [random.randrange(64) for _ in range(12)]
+            suffix = "".join(PUSH_CHARS[i] for i in self._last_random)
+        prefix = []
+        for _ in range(8):
+            now, digit = divmod(now, 64)
+            prefix.append(PUSH_CHARS[digit])
+        return "".join(reversed(prefix)) + suffix
+
+    @staticmethod
+    def is_push_id(key: str) -> bool:
+        """Whether key was made by a PushId (the log keys written before them are uuid4 strings)."""
+        return len(key) == 20 and all(char in PUSH_CHARS for char in key)
+
+    @staticmethod
+    def timestamp(key: str) -> int:
+        """Milliseconds since the epoch encoded in a key."""
+        value = 0
+        for char in key[:8]:
+            value = value * 64 + PUSH_CHARS.index(char)
+        return value
+
+
+push_id = PushId()
+
+
+def increment(value: int | float = 1) -> dict:
+    """Server-side increment; can be used as a value of write and update (also in multi-path updates)."""
+    return {".sv": {"increment": value}}
+
 
 class FirebaseClient:
-    def __init__(self, firebase_url: str, secret: str) -> None:
+    def __init__(self, firebase_url: str, secret: str,
+                 backend: FirebaseBackend = FirebaseBackend.EXECUTOR, pool_size: int = 8, lazy: bool = False) -> None:
         """
         firebase_url: Firebase Runtime DB URL.
         secret: Firebase Runtime DB secret.
+        backend: BLOCKING calls firebase_admin on the event loop (legacy behaviour),
+                 EXECUTOR offloads firebase_admin calls to a thread pool,
+                 REST uses the REST API over a pooled keep-alive aiohttp session.
+        pool_size: worker threads for EXECUTOR, open connections for REST.
+        lazy: initialize the Firebase app on the first request instead of here (fast start).
         """
         self.url = firebase_url
         self.secret = secret
+        self.backend = backend
+        self.pool_size = pool_size
+
+        self._db = None
+        self._connect_lock = threading.Lock()
+        if not lazy:
+            self._db = self._connect()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="firebase") \
+            if backend is FirebaseBackend.EXECUTOR else None
+        self._session = None
+        self._token: str | None = None
+        self._token_expiry: float = 0
 
+    @property
+    def db(self):
+        """Realtime DB module; the first access may come from several executor threads at once."""
+        if self._db is None:
+            with self._connect_lock:
+                if self._db is None:
+                    self._db = self._connect()
+        return self._db
+
+    def _connect(self):
+        """Initialize the default Firebase app once and return the Realtime DB module."""
         if not firebase_admin._apps:
-            cred = credentials.Certificate(secret)
-            firebase_admin.initialize_app(cred, {"databaseURL": firebase_url})
-        self.db = db
+            cred = credentials.Certificate(self.secret)
+            firebase_admin.initialize_app(cred, {"databaseURL": self.url})
+        return db
 
     async def write(self, path: str, data: int|dict|str|object) -> None:
-        self.db.reference(path).set(data)
-
+        await self._request("PUT", path, data)
 
     async def update(self, path: str, data: dict) -> None:
-        self.db.reference(path).update(data)
+        await self._request("PATCH", path, data)
 
+    async def read(self, path: str, shallow: bool = False) -> object|str|int|dict|None:
+        """shallow: children of a dict are replaced by True (only the keys are transferred)."""
+        return await self._request("GET", path, shallow=shallow)
 
-    async def read(self, path: str) -> object|str|int|dict|None:
-        return self.db.reference(path).get()
+    async def read_many(self, paths: list[str]) -> dict[str, object]:
+        """
+        Read several paths at once. The Realtime DB has no multi-get, so the reads
+        are issued concurrently over the pool instead of one round trip after another.
+        """
+        values = await asyncio.gather(*(self.read(path) for path in paths))
+        return dict(zip(paths, values))
 
+    async def query(self, path: str, limit_to_last: int, end_at: str | None = None) -> dict:
+        """
+        The last limit_to_last children of path ordered by key, up to and including end_at.
+        With time-ordered keys (push_id) this pages through history from the newest entry.
+        """
+        result = await self._request("GET", path, query={"limit_to_last": limit_to_last, "end_at": end_at})
+        return dict(sorted(result.items())) if isinstance(result, dict) else {}
 
     async def delete(self, path: str) -> None:
-        self.db.reference(path).delete()
\ No newline at end of file
+        await self._request("DELETE", path)
+
+    async def transaction(self, path: str, function: Callable[[object], object]) -> object:
+        """
+        Atomically replace the value at path by function(current value) and return the new value.
+        The write is conditional on the value not having changed since it was read; on a conflict
+        function is called again with the fresh value (firebase_admin transactions, ETags over REST).
+        """
+        with metrics.track("firebase_request", method="TRANSACTION"):
+            match self.backend:
+                case FirebaseBackend.BLOCKING:
+                    return self.db.reference(path).transaction(function)
+                case FirebaseBackend.EXECUTOR:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor,
+                                                      lambda: self.db.reference(path).transaction(function))
+                case FirebaseBackend.REST:
+                    return await self._rest_transaction(path, function)
+                case _:
+                    raise RuntimeError(f"Unexpected Firebase backend: {self.backend}")
+
+    async def increment(self, path: str, delta: int = 1) -> int:
+        """Atomically add delta to the counter at path (missing counts as 0) and return the new value."""
+        return await self.transaction(path, lambda current: (current or 0) + delta)
+
+    async def close(self) -> None:
+        """Release pooled threads and connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def _request(self, method: str, path: str, data: object = None, shallow: bool = False,
+                       query: dict | None = None) -> object:
+        with metrics.track("firebase_request", method=method):
+            match self.backend:
+                case FirebaseBackend.BLOCKING:
+                    return self._admin_request(method, path, data, shallow, query)
+                case FirebaseBackend.EXECUTOR:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, self._admin_request, method, path, data,
+                                                      shallow, query)
+                case FirebaseBackend.REST:
+                    return await self._rest_request(method, path, data, shallow, query)
+                case _:
+                    raise RuntimeError(f"Unexpected Firebase backend: {self.backend}")
+
+    def _admin_request(self, method: str, path: str, data: object = None, shallow: bool = False,
+                       query: dict | None = None) -> object:
+        ref = self.db.reference(path or "/")
+        match method:
+            case "GET" if query:
+                ordered = ref.order_by_key()
+                if query["end_at"] is not None:
+                    ordered = ordered.end_at(query["end_at"])
+                return ordered.limit_to_last(query["limit_to_last"]).get()
+            case "GET":
+                return ref.get(shallow=shallow)
+            case "PUT":
+                return ref.set(data)
+            case "PATCH":
+                return ref.update(data)
+            case "DELETE":
+                return ref.delete()
+            case _:
+                raise RuntimeError(f"Unexpected Firebase request method: {method}")
+
+    def _rest_session(self):
+        if self._session is None:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _rest_url(self, path: str) -> str:
+        return f"{self.url.rstrip('/')}/{path.strip('/')}.json"
+
+    async def _rest_request(self, method: str, path: str, data: object = None, shallow: bool = False,
+                            query: dict | None = None) -> object:
+        session = self._rest_session()
+        url = self._rest_url(path)
+        params = {"access_token": await self._access_token()}
+        if shallow:
+            params["shallow"] = "true"
+        if query:
+            params["orderBy"] = '"$key"'
+            params["limitToLast"] = str(query["limit_to_last"])
+            if query["end_at"] is not None:
+                params["endAt"] = json.dumps(query["end_at"])
+        async with session.request(method, url, params=params, json=data) as response:
+            if response.status >= 400:
+                raise FirebaseError(str(response.status), await response.text())
+            return await response.json()
+
+    async def _rest_transaction(self, path: str, function: Callable[[object], object],
+                                attempts: int = 25) -> object:
+        session = self._rest_session()
+        url = self._rest_url(path)
+        params = {"access_token": await self._access_token()}
+        async with session.get(url, params=params, headers={"X-Firebase-ETag": "true"}) as response:
+            if response.status >= 400:
+                raise FirebaseError(str(response.status), await response.text())
+            etag, current = response.headers["ETag"], await response.json()
+        for _ in range(attempts):
+            value = function(current)
+            async with session.put(url, params=params, json=value, headers={"if-match": etag}) as response:
+                if response.status == 412:
+                    # Changed since read: the response carries the current value and its ETag.
+                    etag, current = response.headers["ETag"], await response.json()
+                    continue
+                if response.status >= 400:
+                    raise FirebaseError(str(response.status), await response.text())
+                return value
+        raise FirebaseError("ABORTED", f"Transaction on {path} aborted after {attempts} conflicts")
+
+    async def _access_token(self) -> str:
+        """OAuth2 token of the default app credential, refreshed off the loop shortly before expiry."""
+        if self._token is None or time() > self._token_expiry - 60:
+            self.db  # the default app holds the credential
+            credential = firebase_admin.get_app().credential
+            token = await asyncio.get_running_loop().run_in_executor(None, credential.get_access_token)
+            self._token = token.access_token
+            self._token_expiry = token.expiry.replace(tzinfo=timezone.utc).timestamp() if token.expiry else time() + 3600
+        return self._token
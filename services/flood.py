@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict, deque
+from enum import Enum
+from time import monotonic
+from typing import Awaitable, Callable
+
+
+class FloodAction(Enum):
+    """What happens to the sender of a flood copy."""
+    MUTE = "MUTE"
+    KICK = "KICK"
+
+
+class FloodCluster:
+    """Near-duplicate copies of one message; remembers the verdict of the first classified copy."""
+    __slots__ = ("verdict", "pending")
+
+    def __init__(self) -> None:
+        self.verdict: tuple[str, str] | None = None
+        # Set while the first copy is being classified, so the copies arriving meanwhile wait for it.
+        self.pending: asyncio.Future | None = None
+
+
+class FloodEntry:
+    __slots__ = ("simhash", "timestamp", "user_id", "cluster")
+
+    def __init__(self, simhash: int, timestamp: float, user_id: int, cluster: FloodCluster) -> None:
+        self.simhash = simhash
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.cluster = cluster
+
+
+class FloodMatch:
+    """Result of FloodIndex.observe."""
+    __slots__ = ("cluster", "users", "is_flood")
+
+    def __init__(self, cluster: FloodCluster, users: int, is_flood: bool) -> None:
+        self.cluster = cluster
+        self.users = users
+        self.is_flood = is_flood
+
+    @property
+    def verdict(self) -> tuple[str, str] | None:
+        return self.cluster.verdict
+
+    @property
+    def shared(self) -> bool:
+        """The verdict of the cluster is known or being computed."""
+        return self.cluster.verdict is not None or self.cluster.pending is not None
+
+
+class FloodIndex:
+    """
+    Per-chat rolling SimHash index of recent messages.
+    A message whose 64-bit SimHash is within max_distance bits of an indexed one
+    joins its cluster; a cluster posted by flood_users distinct users is a flood.
+    Memory is bounded by window messages per chat and max_chats chats.
+    """
+
+    def __init__(self, window: int = 200, window_seconds: float = 600, max_distance: int = 8,
+                 flood_users: int = 4, min_length: int = 20, max_chats: int = 10000) -> None:
+        """
+        window: messages kept per chat.
+        window_seconds: messages older than this are forgotten.
+        max_distance: largest Hamming distance between near-duplicates.
+        flood_users: distinct senders of near-duplicates that make a flood.
+        min_length: shorter messages are never treated as a flood.
+        max_chats: chats kept in the index, least recently active are dropped.
+        """
+        self.window = window
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self.flood_users = flood_users
+        self.min_length = min_length
+        self.max_chats = max_chats
+        self._chats: OrderedDict[int, deque[FloodEntry]] = OrderedDict()
+
+    @staticmethod
+    def simhash(text: str) -> int:
+        """64-bit SimHash over character trigrams of the normalized text."""
+        text = re.sub(r"\W+", " ", text.casefold()).strip()
+        shingles = [text[i:i + 3] for i in range(max(len(text) - 2, 1))]
+        weights = [0] * 64
+        for shingle in shingles:
+            h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+            for bit in range(64):
+                weights[bit] += 1 if h >> bit & 1 else -1
+        return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+    def observe(self, chat_id: int, user_id: int, text: str) -> FloodMatch:
+        """Index the message and return the near-duplicate cluster it belongs to."""
+        now = monotonic()
+        entries = self._chats.get(chat_id)
+        if entries is None:
+            entries = deque(maxlen=self.window)
+            self._chats[chat_id] = entries
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        while entries and now - entries[0].timestamp > self.window_seconds:
+            entries.popleft()
+
+        simhash = self.simhash(text)
+        cluster = None
+        users = {user_id}
+        for entry in entries:
+            if (entry.simhash ^ simhash).bit_count() <= self.max_distance:
+                cluster = cluster or entry.cluster
+                users.add(entry.user_id)
+        cluster = cluster or FloodCluster()
+        entries.append(FloodEntry(simhash, now, user_id, cluster))
+
+        is_flood = len(text) >= self.min_length and len(users) >= self.flood_users
+        return FloodMatch(cluster, len(users), is_flood)
+
+    @staticmethod
+    async def classify(match: FloodMatch, compute: Callable[[], Awaitable[tuple[str, str]]]) -> tuple[str, str]:
+        """
+        Verdict of the copy: the verdict of its cluster when known, otherwise computed with `compute`
+        once for the copies arriving until it is ready (single flight, like VerdictCache).
+        """
+        cluster = match.cluster
+        if cluster.verdict is not None:
+            return cluster.verdict
+        if cluster.pending is not None:
+            return await asyncio.shield(cluster.pending)
+        future = cluster.pending = asyncio.get_running_loop().create_future()
+        try:
+            verdict = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved: waiters re-raise it, nobody else needs to.
+            future.exception()
+            raise
+        else:
+            cluster.verdict = cluster.verdict or verdict
+            future.set_result(verdict)
+            return verdict
+        finally:
+            cluster.pending = None
+
+    @staticmethod
+    def record_verdict(match: FloodMatch, verdict: tuple[str, str]) -> None:
+        """Remember the verdict of the first classified copy for the following ones."""
+        if match.cluster.verdict is None:
+            match.cluster.verdict = verdict
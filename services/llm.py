@@ -1,57 +1,343 @@
-from functools import lru_cache
-
-from together import AsyncTogether
+import asyncio
+import importlib
+import re
 
 import logging
 import dotenv
 import os
+from enum import Enum
+from typing import Protocol
 
+from services.batch import MessageBatcher
+from services.cache import VerdictCache
 from services.log import ConsoleLog
+from services.metrics import metrics
+
+MODEL = "lgai/exaone-3-5-32b-instruct"
+
+SYSTEM_PROMPT = ("Представь, что ты модератор канала."
+                 "Твоя задача модерация введенного сообщения и его проверка на спам, ненормативную лексику,"
+                 "оскорбления, религиозные риски, публичный вред, агрессию, вредоносность и политику."
+                 "Сообщения, содержащие восхваление стран, одобряющие нацизм, неонацизм, агрессию на рассовой почве "
+                 "НЕ ДОЛЖНЫ пройти модерацию."
+                 "Например: слава + <страна/политический деятель> НЕ ДОЛЖНО ПРОХОДИТЬ МОДЕРАЦИЮ"
+                 "Все, кроме вышеперечисленного, явялется безопасным и должно проходить модерацию."
+                 "Не превышай свои полномочия. Модерацию не должен проходить ИСКЛЮЧИТЕЛЬНО вредоносный контент."
+                 "Если по контексту сообщения не понятно, является ли содержимое вредоносным контентом, то "
+                 "это сообщение БЕЗОПАСНО и ДОЛЖНО проходить модерацию."
+                 "выводи ответ СТРОГО в этом формате:"
+                 "если прошло модерацию: safe"
+                 "Если не прошло: unsafe Reason, вместо Reason напиши что именно не прошло модерацию.")
+
+BATCH_PROMPT = ("Тебе придут несколько независимых сообщений, каждое в формате [N] текст."
+                "Проверь каждое отдельно и для каждого выведи ОДНУ строку СТРОГО в формате:"
+                "N safe или N unsafe Reason, где N – номер сообщения.")
+
+CONTEXT_PROMPT = ("Перед сообщением может быть контекст – предыдущие сообщения чата в формате "
+                  "#номер [автор]: текст. Контекст НЕ проверяй, используй его только чтобы понять сообщение: "
+                  "на что оно отвечает, не продолжает ли оскорбление из нескольких сообщений, не цитата ли это.")
+
+CONTEXT_HEADER = "Контекст:"
+MESSAGE_HEADER = "Сообщение:"
+
+UNSURE_PROMPT = ("Если не можешь уверенно решить, безопасно ли сообщение, вместо ответа выведи: unsure")
+
+BATCH_VERDICT = re.compile(r"^\W*(\d+)\W*\s*(safe|unsafe)\b\W*(.*)$", re.IGNORECASE)
+VERDICT = re.compile(r"^\W*(safe|unsafe)\b\W*(.*)$", re.IGNORECASE | re.DOTALL)
+LEADING_WORD = re.compile(r"^\W*(\w+)(\W)?")
+
+# Local rules of the RULES fallback: obvious spam only (not any link), everything else passes.
+SPAM_RULES = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"(t\.me|telegram\.me)/(\+|joinchat/)",  # private group invites
+    r"\b(bit\.ly|clck\.ru|tinyurl\.com|cutt\.ly|goo\.su|is\.gd)/",  # link shorteners
+    r"заработ\w*.{0,40}(в день|в неделю|без вложений)",
+    r"пиш\w* (мне )?в (лс|личку|личные)",
+)]
+
+
+class FallbackPolicy(Enum):
+    """Verdict of a message whose check ran out of its latency budget."""
+    SAFE = "SAFE"
+    RULES = "RULES"
+
+
+class LatencyBudgetExceeded(Exception):
+    pass
+
+
+class ModerationBackend(Protocol):
+    """Moderation model running beside the LLM (e.g. services.classifier.LocalClassifier)."""
+
+    async def classify(self, messages: list[tuple[str, str]]) -> list[tuple[str, str] | None]:
+        """(status, reason) of every (message, context) pair, None where it is not sure."""
+        ...
+
+
+def parse_verdict(response: str | None) -> tuple[str, str] | None:
+    """
+    (status, reason) of an answer whose first word is safe or unsafe, whatever the case, markup or
+    punctuation around it ("**Unsafe**: spam", "safe."). None for anything else – an empty answer,
+    unsure, a refusal – never an exception.
+    """
+    match = VERDICT.match(response.strip()) if response else None
+    if match is None:
+        return None
+    status, reason = match.groups()
+    return status.lower(), " ".join(reason.split())
+
+
+def leading_status(partial: str) -> str | None:
+    """
+    First word of a partially received answer, lower-cased, as soon as it is known; None while it may
+    still grow. "safe" is taken at once: the answer format leaves nothing else it could turn into.
+    """
+    match = LEADING_WORD.match(partial)
+    if match is None:
+        return None
+    word = match.group(1).lower()
+    return word if word == "safe" or match.group(2) is not None else None
+
 
 class LLMService:
-    def __init__(self, console_log: ConsoleLog) -> None:
+    def __init__(self, console_log: ConsoleLog, verdict_cache: VerdictCache | None = None,
+                 batch_size: int = 1, batch_delay: float = 0.05, lazy: bool = False,
+                 models: list[str] | None = None, tier_timeout: float = 2.0, latency_budget: float | None = 10.0,
+                 fallback: FallbackPolicy = FallbackPolicy.SAFE, stream: bool = False,
+                 reason_tokens: int = 64, backend: ModerationBackend | None = None, remote: bool = True) -> None:
+        """
+        verdict_cache: optional cache used by validate_message_cached.
+        batch_size: with more than 1, messages arriving within batch_delay seconds
+                    are checked together in one completion of up to batch_size messages.
+        lazy: import the LLM SDK and create the client on first use instead of here (fast start).
+        models: model tiers from the smallest to the largest. A message goes to the next tier only
+                when the answer is unsure or unparseable, or the tier takes longer than tier_timeout.
+        latency_budget: seconds a message may take in total (None – no limit); past it the verdict
+                        comes from the fallback policy and is not cached. The default is well above
+                        a normal answer, so only a stalled API or a long queue reaches it.
+        stream: stream single-message answers and stop reading as soon as the first word decides
+                (safe, or not a verdict at all); only an unsafe answer is read on, for the reason.
+        reason_tokens: max_tokens of a streamed answer, caps the reason of an unsafe verdict.
+        backend: checks every message first; the LLM gets only the messages it is not sure about.
+        remote: False – never call the LLM (offline, load tests): undecided messages are safe.
+        """
+        if not remote and backend is None:
+            raise ValueError("A moderation backend is required when the LLM is not used")
         dotenv.load_dotenv()
         self.console_logs = console_log.with_name(__name__)
+        self.verdict_cache = verdict_cache
+        self.models = models or [MODEL]
+        self.tier_timeout = tier_timeout
+        self.latency_budget = latency_budget
+        self.fallback = fallback
+        self.stream = stream
+        self.reason_tokens = reason_tokens
+        self.backend = backend
+        self.remote = remote
+        self.batcher = MessageBatcher(self._validate_batch, max_batch=batch_size, max_delay=batch_delay) \
+            if batch_size > 1 else None
+        self._client = None
+        if not lazy and remote:
+            self._client = self._create_client()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    async def warm(self) -> None:
+        """Import the SDK off the event loop, so the first validation does not pay for it."""
+        if not self.remote:
+            return
+        await asyncio.to_thread(importlib.import_module, "together")
+
+    def _create_client(self):
         try:
-            self.client = AsyncTogether(api_key=os.getenv('LLM_API_KEY'))
+            from together import AsyncTogether
+            client = AsyncTogether(api_key=os.getenv('LLM_API_KEY'))
             self.console_logs.write(status=logging.INFO, msg="LLM initialized successfully")
+            return client
         except Exception as e:
             self.console_logs.write(status=logging.ERROR, msg=f"LLM initialization failed: {e}")
             raise RuntimeError(f"LLM initialization failed: {e}") from e
 
-    @lru_cache(maxsize=512)
-    async def validate_message_cached(self, message: str) -> (str, str):
-        return await self.validate_message(message)
-
-    async def validate_message(self, message: str) -> (str, str):
-        self.console_logs.write(status=logging.INFO, msg="Validating message...")
-        response = await self.client.chat.completions.create(
-            model="lgai/exaone-3-5-32b-instruct",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Представь, что ты модератор канала."
-                               "Твоя задача модерация введенного сообщения и его проверка на спам, ненормативную лексику,"
-                               "оскорбления, религиозные риски, публичный вред, агрессию, вредоносность и политику."
-                               "Сообщения, содержащие восхваление стран, одобряющие нацизм, неонацизм, агрессию на рассовой почве "
-                               "НЕ ДОЛЖНЫ пройти модерацию."
-                               "Например: слава + <страна/политический деятель> НЕ ДОЛЖНО ПРОХОДИТЬ МОДЕРАЦИЮ"
-                               "Все, кроме вышеперечисленного, явялется безопасным и должно проходить модерацию."
-                               "Не превышай свои полномочия. Модерацию не должен проходить ИСКЛЮЧИТЕЛЬНО вредоносный контент."
-                               "Если по контексту сообщения не понятно, является ли содержимое вредоносным контентом, то "
-                               "это сообщение БЕЗОПАСНО и ДОЛЖНО проходить модерацию."
-                               "выводи ответ СТРОГО в этом формате:"
-                               "если прошло модерацию: safe"
-                               "Если не прошло: unsafe Reason, вместо Reason напиши что именно не прошло модерацию."
-                },
-                {
-                    "role": "user",
-                    "content": f"{message}"
-                }
-            ],
-        )
-        llm_response = response.choices[0].message.content
-        await self.console_logs.awrite(status=logging.INFO, msg=f"LLM response: {llm_response}")
-        parsed_response = llm_response.split()
-        status, reason = parsed_response[0], ' '.join(parsed_response[1:])
-        return status, reason
+    async def validate_message_cached(self, message: str, context: str = "") -> (str, str):
+        """validate_message behind the verdict cache (if one is configured)."""
+        if self.verdict_cache is None:
+            return await self.validate_message(message, context)
+        try:
+            return await self.verdict_cache.get_or_compute(message, lambda: self._validate(message, context),
+                                                           context=context)
+        except LatencyBudgetExceeded:
+            return self._fallback(message)
+
+    async def validate_message(self, message: str, context: str = "") -> (str, str):
+        """context: previous messages of the chat (ChatContext.render), helps to judge replies and quotes."""
+        try:
+            return await self._validate(message, context)
+        except LatencyBudgetExceeded:
+            return self._fallback(message)
+
+    async def _validate(self, message: str, context: str) -> (str, str):
+        with metrics.track("llm_validate"):
+            try:
+                if self.batcher is not None:
+                    return await asyncio.wait_for(self.batcher.submit((message, context)), self.latency_budget)
+                return await asyncio.wait_for(self._check(message, context), self.latency_budget)
+            except asyncio.TimeoutError:
+                raise LatencyBudgetExceeded(f"No verdict within {self.latency_budget}s")
+
+    def _fallback(self, message: str) -> (str, str):
+        metrics.inc("llm_fallbacks_total", policy=self.fallback.value)
+        self.console_logs.write(status=logging.WARNING, msg=f"LLM latency budget exceeded, {self.fallback.value} verdict")
+        match self.fallback:
+            case FallbackPolicy.RULES if any(rule.search(message) for rule in SPAM_RULES):
+                return "unsafe", "Спам (автоматическая проверка без LLM)"
+            case _:
+                return "safe", ""
+
+    async def _route(self, message: str, context: str, first_tier: int = 0) -> (str, str):
+        """Ask the tiers from first_tier on until one gives a verdict; the last tier always decides."""
+        last = len(self.models) - 1
+        for tier in range(first_tier, last + 1):
+            model = self.models[tier]
+            try:
+                with metrics.track("llm_tier", model=model):
+                    if tier < last:
+                        response = await asyncio.wait_for(self._complete(model, message, context, unsure=True),
+                                                          self.tier_timeout)
+                    else:
+                        response = await self._complete(model, message, context, unsure=False)
+            except asyncio.TimeoutError:
+                metrics.inc("llm_escalations_total", model=model, cause="timeout")
+                continue
+            verdict = parse_verdict(response)
+            if verdict is not None:
+                return verdict
+            if tier < last:
+                metrics.inc("llm_escalations_total", model=model, cause="unsure")
+                continue
+            metrics.inc("llm_unparseable_total", model=model)
+            await self.console_logs.awrite(status=logging.WARNING, msg=f"Unparseable LLM response: {response!r}")
+        # The last tier answered something that is neither safe nor unsafe: when in doubt, the message is safe.
+        return "safe", ""
+
+    async def _complete(self, model: str, message: str, context: str, unsure: bool) -> str:
+        self.console_logs.write(status=logging.INFO, msg=f"Validating message with {model}...", sampled=True)
+        system = SYSTEM_PROMPT + (CONTEXT_PROMPT if context else "") + (UNSURE_PROMPT if unsure else "")
+        messages = [
+            {
+                "role": "system",
+                "content": system
+            },
+            {
+                "role": "user",
+                "content": f"{CONTEXT_HEADER}\n{context}\n\n{MESSAGE_HEADER}\n{message}" if context else f"{message}"
+            }
+        ]
+        if self.stream:
+            llm_response = await self._stream(model, messages)
+        else:
+            response = await self.client.chat.completions.create(model=model, messages=messages)
+            llm_response = response.choices[0].message.content
+        await self.console_logs.awrite(status=logging.INFO, msg=f"LLM response: {llm_response}", sampled=True)
+        return llm_response
+
+    async def _stream(self, model: str, messages: list[dict]) -> str:
+        """The answer up to the point where it decides: the first word, or all of it for unsafe."""
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                           max_tokens=self.reason_tokens)
+        response = ""
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    response += chunk.choices[0].delta.content or ""
+                status = leading_status(response)
+                if status is not None and status != "unsafe":
+                    metrics.inc("llm_streams_cut_total", model=model)
+                    break
+        finally:
+            # Closing the generator closes the HTTP response: the rest of the answer is not generated.
+            await stream.aclose()
+        return response
+
+    async def _check(self, message: str, context: str) -> (str, str):
+        return (await self._validate_batch([(message, context)]))[0]
+
+    async def _validate_batch(self, messages: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """The backend (if any) decides first, the LLM gets the messages it is not sure about."""
+        if self.backend is None:
+            return await self._ask_llm(messages)
+        with metrics.track("moderation_backend"):
+            verdicts = await self.backend.classify(messages)
+        undecided = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        metrics.inc("moderation_backend_undecided_total", len(undecided))
+        if undecided and self.remote:
+            for i, verdict in zip(undecided, await self._ask_llm([messages[i] for i in undecided])):
+                verdicts[i] = verdict
+        return [verdict or ("safe", "") for verdict in verdicts]
+
+    async def _ask_llm(self, messages: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """
+        Check several (message, context) pairs in one completion of the first tier. Messages missing from
+        the answer or answered unsure go through the remaining tiers one by one (with a single tier, they
+        are asked again alone). The context of a message follows it on lines starting with ">".
+        """
+        if len(messages) == 1:
+            return [await self._route(*messages[0])]
+
+        model = self.models[0]
+        escalate = len(self.models) > 1
+        self.console_logs.write(status=logging.INFO, msg=f"Validating batch of {len(messages)} messages...",
+                               sampled=True)
+        try:
+            with metrics.track("llm_tier", model=model):
+                completion = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": SYSTEM_PROMPT + CONTEXT_PROMPT + (UNSURE_PROMPT if escalate else "") + BATCH_PROMPT
+                        },
+                        {
+                            "role": "user",
+                            "content": "\n".join(self._batch_entry(i, message, context)
+                                                 for i, (message, context) in enumerate(messages, 1))
+                        }
+                    ],
+                )
+                response = await (asyncio.wait_for(completion, self.tier_timeout) if escalate else completion)
+            llm_response = response.choices[0].message.content
+        except asyncio.TimeoutError:
+            metrics.inc("llm_escalations_total", model=model, cause="timeout")
+            llm_response = ""
+        await self.console_logs.awrite(status=logging.INFO, msg=f"LLM batch response: {llm_response}",
+                                       sampled=True)
+
+        verdicts: dict[int, tuple[str, str]] = {}
+        for line in llm_response.splitlines():
+            match = BATCH_VERDICT.match(line.strip())
+            if match:
+                index, status, reason = match.groups()
+                verdicts.setdefault(int(index), (status.lower(), reason.strip()))
+
+        results = []
+        for i, (message, context) in enumerate(messages, 1):
+            verdict = verdicts.get(i)
+            if verdict is None:
+                if escalate:
+                    metrics.inc("llm_escalations_total", model=model, cause="unsure")
+                verdict = await self._route(message, context, first_tier=1 if escalate else 0)
+            results.append(verdict)
+        return results
+
+    @staticmethod
+    def _batch_entry(index: int, message: str, context: str) -> str:
+        entry = f"[{index}] {' '.join(message.split())}"
+        if context:
+            entry += "".join(f"\n> {line}" for line in context.splitlines())
+        return entry
@@ -1,5 +1,13 @@
+import asyncio
+import atexit
+import copy
+import json
 import logging
-import uuid
+import queue
+import random
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 from abc import abstractmethod
 from typing import Protocol, Any, Self
 from enum import Enum
@@ -8,7 +16,8 @@ from firebase_admin.exceptions import FirebaseError
 from time import time
 from pydantic import BaseModel
 
-from services.firebase import FirebaseClient
+from services.firebase import FirebaseClient, push_id, increment
+from services.metrics import metrics
 
 class Log(Protocol):
     @abstractmethod
@@ -38,51 +47,45 @@ class FirebaseLogFormat(BaseModel):
 
 
 class FirebaseLog(FirebaseClient):
-    """Firebase Realtime DB Logs."""
+    """
+    Firebase Realtime DB Logs.
+    Each entry is written with one multi-path update:
+        logs/{chat_id}/{key}                          the entry, key is a time-ordered push id
+        logs_by_user/{chat_id}/{user_id}/{key}        action of the entry
+        logs_by_action/{chat_id}/{action}/{key}       user_id of the entry
+        logs_rollup/{chat_id}/{YYYY-MM-DD}/{action}   number of entries of the day (UTC)
+    """
     async def awrite(self, status: Any, msg: Any) -> None:
         """
         Write log message in Firebase Runtime DB.
-        msg should be 'FireBaseLogFormat' class instance.
+        msg should be 'FireBaseLogFormat' class instance (its JSON is accepted too).
         status should be 'FirebaseAction' class instance.
         """
-        log = FirebaseLogFormat.model_validate_json(msg)
-        event = uuid.uuid4()
-        ref = self.db.reference(f"logs/{log.chat_id}/{event}")
-        timestamp = int(time() * 1000)
-        data = {
-            "timestamp": timestamp,
-            "user_id": log.user_id,
-            "message": log.message,
-            "reason": log.reason,
-        }
-
-        match status:
-            case FirebaseAction.BAN:
-                data |= {"action": FirebaseAction.BAN.value}
-            case FirebaseAction.UNBAN:
-                data |= {"action": FirebaseAction.UNBAN.value}
-            case FirebaseAction.MUTE:
-                data |= {"action": FirebaseAction.MUTE.value}
-            case FirebaseAction.UNMUTE:
-                data |= {"action": FirebaseAction.UNMUTE.value}
-            case _:
-                raise RuntimeError(f"Unexpected Firebase Log Format: {status}")
-
-        try:
-            ref.set(data)
-        except FirebaseError as e:
-            raise Exception(f"FirebaseError: {e}")
+        updates, rollup = self._entry(status, msg)
+        with metrics.track("firebase_log_write"):
+            try:
+                await super().update("/", updates | {rollup: increment()})
+            except FirebaseError as e:
+                raise Exception(f"FirebaseError: {e}")
 
     def write(self, status: Any, msg: Any) -> None:
         """
         Write log message in Firebase Runtime DB.
-        msg should be 'FireBaseLogFormat' class instance.
+        msg should be 'FireBaseLogFormat' class instance (its JSON is accepted too).
         status should be 'FirebaseAction' class instance.
         """
-        log = FirebaseLogFormat.model_validate_json(msg)
-        event = uuid.uuid4()
-        ref = self.db.reference(f"logs/{log.chat_id}/{event}")
+        updates, rollup = self._entry(status, msg)
+        try:
+            self._admin_request("PATCH", "/", updates | {rollup: increment()})
+        except FirebaseError as e:
+            raise Exception(f"FirebaseError: {e}")
+
+    @staticmethod
+    def _entry(status: Any, msg: Any) -> tuple[dict[str, object], str]:
+        """Build the paths and payloads of a log entry and its indexes, and the path of its rollup counter."""
+        log = msg if isinstance(msg, FirebaseLogFormat) else FirebaseLogFormat.model_validate_json(msg)
         timestamp = int(time() * 1000)
+        event = push_id(timestamp)
         data = {
             "timestamp": timestamp,
             "user_id": log.user_id,
@@ -101,23 +104,168 @@ class FirebaseLog(FirebaseClient):
                 data |= {"action": FirebaseAction.UNMUTE.value}
             case _:
                 raise RuntimeError(f"Unexpected Firebase Log Format: {status}")
+        action = data["action"]
+        day = datetime.fromtimestamp(timestamp / 1000, timezone.utc).strftime("%Y-%m-%d")
+        updates = {
+            f"logs/{log.chat_id}/{event}": data,
+            f"logs_by_user/{log.chat_id}/{log.user_id}/{event}": action,
+            f"logs_by_action/{log.chat_id}/{action}/{event}": log.user_id,
+        }
+        return updates, f"logs_rollup/{log.chat_id}/{day}/{action}"
+
+
+class BufferedFirebaseLog(FirebaseLog):
+    """
+    Write-behind Firebase Realtime DB Logs.
+    Entries are buffered and committed as one multi-path update when the buffer
+    reaches max_batch entries or every flush_interval seconds, whichever comes first.
+    """
+
+    def __init__(self, firebase_url: str, secret: str, max_batch: int = 100, flush_interval: float = 0.5,
+                 **kwargs: Any) -> None:
+        super().__init__(firebase_url=firebase_url, secret=secret, **kwargs)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._buffer: list[tuple[dict[str, object], str, asyncio.Future | None]] = []
+        self._wakeup = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._closing = False
+
+    async def awrite(self, status: Any, msg: Any, durable: bool = False) -> None:
+        """
+        Enqueue log message.
+        durable=False returns as soon as the entry is buffered,
+        durable=True waits until the batch containing it is committed.
+        """
+        if self._closing:
+            return await super().awrite(status, msg)
+
+        with metrics.track("firebase_log_write"):
+            updates, rollup = self._entry(status, msg)
+            commit = asyncio.get_running_loop().create_future() if durable else None
+            self._buffer.append((updates, rollup, commit))
+
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self._flush_loop())
+            if len(self._buffer) >= self.max_batch:
+                self._wakeup.set()
+            if commit is not None:
+                await commit
 
+    async def flush(self) -> None:
+        """Commit everything buffered so far in a single multi-path update."""
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        payload = {}
+        for updates, _, _ in batch:
+            payload |= updates
+        # Entries of the same chat, day and action share a counter: one increment by their number.
+        for rollup, count in Counter(rollup for _, rollup, _ in batch).items():
+            payload[rollup] = increment(count)
         try:
-            ref.set(data)
-        except FirebaseError as e:
-            raise Exception(f"FirebaseError: {e}")
+            await self.update("/", payload)
+        except Exception as e:  # FirebaseError or a transport error of the REST backend
+            logging.getLogger(__name__).error(f"Dropped {len(batch)} log entries: {e!r}")
+            for _, _, commit in batch:
+                if commit is not None and not commit.done():
+                    commit.set_exception(Exception(f"Log flush failed: {e!r}"))
+            return
+        for _, _, commit in batch:
+            if commit is not None and not commit.done():
+                commit.set_result(None)
+
+    async def close(self) -> None:
+        """Drain the buffer, then release the connection pool."""
+        self._closing = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            await self._flusher
+        await self.flush()
+        await super().close()
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.getLogger(__name__).exception(f"Log flush loop iteration failed: {e!r}")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; chat_id and user_id are included when the record has them."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("chat_id", "user_id"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Enqueues the record as it is. The stdlib prepare() formats it on the caller's thread and drops
+    exc_info, so the listener's formatter (JsonFormatter) would lose the exception field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_configured = False
+
+
+def _configure(formater: str, level: int, structured: bool, queued: bool) -> None:
+    """Install the root handler once; later ConsoleLog instances share it."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if structured else logging.Formatter(formater))
+    if queued:
+        # Formatting and stream I/O happen on the listener thread, the event loop only enqueues.
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = _RecordQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
 
 
 class ConsoleLog(Log):
     """Console Log."""
 
-    def __init__(self, formater: str, level: int = logging.INFO, name: str = "__main__") -> None:
+    def __init__(self, formater: str, level: int = logging.INFO, name: str = "__main__",
+                 structured: bool = False, queued: bool = False, sample_rate: float = 1.0) -> None:
         """
         formater: format string for log message
         level: log level INFO by default
+        structured: emit JSON records with chat_id/user_id fields instead of formater lines
+        queued: hand records to a background thread instead of writing on the caller's thread
+        sample_rate: share of sampled=True INFO messages that are written
+        The logging configuration is installed by the first ConsoleLog and shared by the rest.
         """
-        logging.basicConfig(format=formater, level=level)
+        _configure(formater, level, structured, queued)
         self.formater = formater
+        self.sample_rate = sample_rate
         self.logger = logging.getLogger(name)
 
     def set_name(self, name: str) -> Self:
@@ -127,41 +275,39 @@ class ConsoleLog(Log):
 
     def with_name(self, name: str) -> Self:
         """Creates a new instance of ConsoleLog with a different logger name."""
-        return ConsoleLog(formater=self.formater, level=self.logger.level, name=name)
+        clone = copy.copy(self)
+        clone.logger = logging.getLogger(name)
+        return clone
 
     def set_level(self, level: int) -> Self:
         """alias for logging.setLevel(level)"""
         self.logger.setLevel(level)
         return self
 
-    async def awrite(self, status: Any, msg: Any) -> None:
+    async def awrite(self, status: Any, msg: Any, chat_id: int | None = None, user_id: int | None = None,
+                     sampled: bool = False) -> None:
         """Write log message in console."""
-        match status:
-            case logging.INFO:
-                self.logger.info(msg)
-            case logging.WARNING:
-                self.logger.warning(msg)
-            case logging.ERROR:
-                self.logger.error(msg)
-            case logging.CRITICAL:
-                self.logger.critical(msg)
-            case logging.NOTSET:
-                self.logger.debug(msg)
-            case _:
-                raise RuntimeError(f"Unexpected Console Log Format: {status}")
+        self.write(status, msg, chat_id=chat_id, user_id=user_id, sampled=sampled)
 
-    def write(self, status: Any, msg: Any) -> None:
-        """Async write log message in console."""
+    def write(self, status: Any, msg: Any, chat_id: int | None = None, user_id: int | None = None,
+              sampled: bool = False) -> None:
+        """
+        Write log message in console.
+        sampled: hot-path INFO message, written only for sample_rate of the calls.
+        """
+        if sampled and status == logging.INFO and random.random() >= self.sample_rate:
+            return
+        extra = {"chat_id": chat_id, "user_id": user_id}
         match status:
             case logging.INFO:
-                self.logger.info(msg)
+                self.logger.info(msg, extra=extra)
             case logging.WARNING:
-                self.logger.warning(msg)
+                self.logger.warning(msg, extra=extra)
             case logging.ERROR:
-                self.logger.error(msg)
+                self.logger.error(msg, extra=extra)
             case logging.CRITICAL:
-                self.logger.critical(msg)
+                self.logger.critical(msg, extra=extra)
             case logging.NOTSET:
-                self.logger.debug(msg)
+                self.logger.debug(msg, extra=extra)
             case _:
                 raise RuntimeError(f"Unexpected Console Log Format: {status}")
@@ -0,0 +1,175 @@
+import bisect
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf when it is past the last bucket)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Tracker:
+    """Context manager of Metrics.track: in-flight gauge and latency histogram of one stage."""
+    __slots__ = ("metrics", "key", "start")
+
+    def __init__(self, metrics: "Metrics", key: tuple) -> None:
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self) -> None:
+        self.metrics._inflight[self.key] = self.metrics._inflight.get(self.key, 0) + 1
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        metrics = self.metrics
+        metrics._inflight[self.key] -= 1
+        histogram = metrics._histograms.get(self.key)
+        if histogram is None:
+            histogram = metrics._histograms[self.key] = Histogram()
+        histogram.observe(perf_counter() - self.start)
+        if exc_type is not None:
+            name, *labels = self.key
+            metrics._add((f"{name}_errors_total", *sorted((*labels, ("error", exc_type.__name__)))))
+
+
+class _NoopTracker:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopTracker()
+
+
+class Metrics:
+    """
+    In-process registry of counters, in-flight gauges and latency histograms.
+    While disabled every call returns at once, so instrumented code pays one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._counters: dict[tuple, float] = {}
+        self._inflight: dict[tuple, int] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def track(self, name: str, **labels: str):
+        """
+        with metrics.track("firebase_request", method="GET"): ...
+        Records name_seconds, name_inflight and name_errors_total{error=<exception class>}.
+        """
+        if not self.enabled:
+            return _NOOP
+        return _Tracker(self, (name, *sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        self._add((name, *sorted(labels.items())), value)
+
+    def summary(self) -> list[str]:
+        """Human-readable lines for the /stats command."""
+        lines = []
+        for key, histogram in sorted(self._histograms.items()):
+            lines.append(f"{self._series(key)}: n={histogram.count} "
+                         f"avg={histogram.sum / histogram.count * 1000:.0f}ms "
+                         f"p99<={histogram.quantile(0.99) * 1000:.0f}ms "
+                         f"inflight={self._inflight.get(key, 0)}")
+        for key, value in sorted(self._counters.items()):
+            lines.append(f"{self._series(key)}: {value:g}")
+        return lines
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for key, value in sorted(self._counters.items()):
+            lines.append(f"{self._series(key)} {value:g}")
+        for key, value in sorted(self._inflight.items()):
+            lines.append(f"{self._series(key, suffix='_inflight')} {value}")
+        for key, histogram in sorted(self._histograms.items()):
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f"{self._series(key, suffix='_seconds_bucket', le=str(bound))} {cumulative}")
+            lines.append(f"{self._series(key, suffix='_seconds_sum')} {histogram.sum}")
+            lines.append(f"{self._series(key, suffix='_seconds_count')} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, key: tuple, value: float = 1) -> None:
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    @staticmethod
+    def _series(key: tuple, suffix: str = "", **extra: str) -> str:
+        name, *labels = key
+        labels += extra.items()
+        if not labels:
+            return f"{name}{suffix}"
+        rendered = ",".join(f'{label}="{_escape(value)}"' for label, value in labels)
+        return f"{name}{suffix}{{{rendered}}}"
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    """Local aiohttp endpoint serving the registry for a Prometheus scrape."""
+
+    def __init__(self, registry: Metrics = metrics, host: str = "127.0.0.1", port: int = 9090) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: "web.AppRunner | None" = None
+
+    async def handle(self, _: "web.Request") -> "web.Response":
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable
+
+from services.firebase import FirebaseClient
+
+
+class _PendingStrikes:
+    """Strikes of one user requested while the previous increment was in flight; committed as one."""
+    __slots__ = ("count", "result")
+
+    def __init__(self, result: asyncio.Future) -> None:
+        self.count = 0
+        self.result = result
+
+
+class ModerationStore:
+    """
+    In-process copy of the moderation/{chat_id}/{user_id} records.
+    Reads are served from memory, changes are persisted to Firebase
+    by a periodic snapshot of the records touched since the last one.
+    Strikes are the exception: add_strike increments them atomically in Firebase,
+    so concurrent strikes (or other processes) never overwrite each other.
+    """
+
+    def __init__(self, firebase_client: FirebaseClient, snapshot_interval: float = 5.0) -> None:
+        """
+        firebase_client: client used to warm and persist the store.
+        snapshot_interval: seconds between two snapshots of dirty records.
+        """
+        self.firebase_db = firebase_client
+        self.snapshot_interval = snapshot_interval
+        self._records: dict[tuple[int, int], dict] = {}
+        self._dirty: dict[tuple[int, int], set[str]] = {}
+        self._pending_strikes: dict[tuple[int, int], _PendingStrikes] = {}
+        self._incrementers: dict[tuple[int, int], asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+
+    async def warm(self, owns_chat: Callable[[int], bool] | None = None) -> None:
+        """
+        Load the moderation records from Firebase. Call once at startup.
+        owns_chat: load only the chats it accepts (the chats of this shard).
+        """
+        data = await self.firebase_db.read("moderation") or {}
+        for chat_id, users in data.items():
+            if owns_chat is not None and not owns_chat(int(chat_id)):
+                continue
+            for user_id, record in (users or {}).items():
+                self._records[(int(chat_id), int(user_id))] = dict(record or {})
+
+    def start(self) -> None:
+        """Start the background snapshot task."""
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._snapshot_loop())
+
+    def get(self, chat_id: int, user_id: int) -> dict:
+        """Moderation record of the user in the chat (empty if there is none)."""
+        return self._records.get((chat_id, user_id), {})
+
+    def get_strikes(self, chat_id: int, user_id: int) -> int:
+        return self.get(chat_id, user_id).get("strikes", 0)
+
+    def set_strikes(self, chat_id: int, user_id: int, strikes: int) -> None:
+        self._set(chat_id, user_id, strikes=strikes)
+
+    async def add_strike(self, chat_id: int, user_id: int) -> int:
+        """
+        Add a strike and return the counter value this strike produced (the authoritative one).
+        Strikes of the same user that arrive while an increment is in flight are merged into
+        the next single increment; each caller still gets its own consecutive value.
+        """
+        key = (chat_id, user_id)
+        pending = self._pending_strikes.get(key)
+        if pending is None:
+            pending = self._pending_strikes[key] = _PendingStrikes(asyncio.get_running_loop().create_future())
+        pending.count += 1
+        position = pending.count
+        if key not in self._incrementers:
+            self._incrementers[key] = asyncio.create_task(self._increment_strikes(key))
+        total = await asyncio.shield(pending.result)
+        return total - pending.count + position
+
+    async def decay_strike(self, chat_id: int, user_id: int) -> int:
+        """Atomically take one strike off (not below zero) and return the remaining count."""
+        key = (chat_id, user_id)
+        if "strikes" in self._dirty.get(key, ()):
+            # An unsnapshotted reset or locally counted strike: adjust it, the snapshot persists it.
+            strikes = max(self.get_strikes(chat_id, user_id) - 1, 0)
+            self.set_strikes(chat_id, user_id, strikes)
+            return strikes
+        strikes = await self.firebase_db.transaction(f"moderation/{chat_id}/{user_id}/strikes",
+                                                     lambda current: max((current or 0) - 1, 0))
+        self._records.setdefault(key, {})["strikes"] = strikes
+        return strikes
+
+    def set_muted_until(self, chat_id: int, user_id: int, until_date: datetime | None) -> None:
+        """Remember when the current mute ends (None – until unmuted manually)."""
+        self._set(chat_id, user_id, muted_until=int(until_date.timestamp()) if until_date else 0)
+
+    async def snapshot(self) -> None:
+        """Persist the fields changed since the previous snapshot in one multi-path update."""
+        dirty, self._dirty = self._dirty, {}
+        updates = {
+            f"moderation/{chat_id}/{user_id}/{field}": self._records[(chat_id, user_id)][field]
+            for (chat_id, user_id), fields in dirty.items()
+            for field in fields
+        }
+        if not updates:
+            return
+        try:
+            await self.firebase_db.update("/", updates)
+        except Exception as e:  # FirebaseError or a transport error of the REST backend
+            logging.getLogger(__name__).error(f"Moderation snapshot failed, will retry: {e!r}")
+            for key, fields in dirty.items():
+                self._dirty.setdefault(key, set()).update(fields)
+
+    async def close(self) -> None:
+        """Stop the snapshot task and persist pending changes."""
+        if self._incrementers:
+            await asyncio.gather(*self._incrementers.values(), return_exceptions=True)
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        await self.snapshot()
+
+    async def _increment_strikes(self, key: tuple[int, int]) -> None:
+        """Commit the pending strikes of one user, one transaction at a time, until none are left."""
+        chat_id, user_id = key
+        pending = None
+        try:
+            while (pending := self._pending_strikes.pop(key, None)) is not None:
+                record = self._records.setdefault(key, {})
+                # A reset not yet snapshotted is the base of the increment instead of the stored value.
+                reset = "strikes" in self._dirty.get(key, ())
+                if reset:
+                    self._dirty[key].discard("strikes")
+                base = record.get("strikes", 0)
+                try:
+                    total = await self.firebase_db.transaction(
+                        f"moderation/{chat_id}/{user_id}/strikes",
+                        lambda current: (base if reset else current or 0) + pending.count)
+                except Exception as e:  # FirebaseError or a transport error of the REST backend
+                    logging.getLogger(__name__).error(f"Strike increment failed, counted locally: {e!r}")
+                    total = base + pending.count
+                    self._dirty.setdefault(key, set()).add("strikes")
+                record["strikes"] = total
+                pending.result.set_result(total)
+        finally:
+            if pending is not None and not pending.result.done():
+                pending.result.cancel()
+            del self._incrementers[key]
+
+    def _set(self, chat_id: int, user_id: int, **fields: object) -> None:
+        self._records.setdefault((chat_id, user_id), {}).update(fields)
+        self._dirty.setdefault((chat_id, user_id), set()).update(fields)
+
+    async def _snapshot_loop(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logging.getLogger(__name__).exception(f"Moderation snapshot loop iteration failed: {e!r}")
@@ -0,0 +1,189 @@
+import asyncio
+import itertools
+from datetime import timedelta
+from enum import IntEnum
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+from telegram.error import RetryAfter
+
+from services.metrics import metrics
+
+
+class ActionPriority(IntEnum):
+    """Lower value is sent first."""
+    PUNITIVE = 0
+    DELETE = 1
+    NOTIFY = 2
+
+
+# Calls that post a message to the chat: only these count against Telegram's per-chat message limit.
+MESSAGE_METHODS = ("send_", "reply_", "forward_", "copy_")
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations: a negative balance is paid back by waiting."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds to wait before using it."""
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def idle(self) -> bool:
+        return self.tokens + (monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class _Action:
+    __slots__ = ("priority", "order", "chat_id", "call", "args", "kwargs", "future", "attempt", "reserved")
+
+    def __init__(self, priority: ActionPriority, order: int, chat_id: int, call: Callable[..., Awaitable[Any]],
+                 args: tuple, kwargs: dict, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.order = order
+        self.chat_id = chat_id
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempt = 0
+        self.reserved = False
+
+    def __lt__(self, other: "_Action") -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class ActionScheduler:
+    """
+    Central queue for outbound Telegram calls.
+    Calls are rate limited by a global token bucket, messages posted to a chat also by a per-chat
+    one (admin actions such as restrict, ban or delete are not subject to the group message limit).
+    They run concurrently by a pool of workers in priority order and are retried after 429
+    RetryAfter errors.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 20 / 60, chat_burst: int = 20,
+                 workers: int = 16, max_retries: int = 3) -> None:
+        """
+        global_rate: calls per second over all chats.
+        chat_rate: messages per second in one chat, chat_burst of them may go at once.
+        workers: calls in flight at the same time.
+        max_retries: retries of a call answered with RetryAfter.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._queue: asyncio.PriorityQueue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._order = itertools.count()
+        self._outstanding: set[asyncio.Future] = set()
+        self.retries = 0
+
+    async def run(self, priority: ActionPriority, chat_id: int, call: Callable[..., Awaitable[Any]], /,
+                  *args: Any, **kwargs: Any) -> Any:
+        """
+        Schedule call(*args, **kwargs) and wait for its result.
+        The own parameters are positional-only, so chat_id=... is passed through to the call.
+        """
+        if self._queue is None:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._outstanding.add(future)
+        future.add_done_callback(self._outstanding.discard)
+        self._queue.put_nowait(_Action(priority, next(self._order), chat_id, call, args, kwargs, future))
+        return await future
+
+    async def close(self) -> None:
+        """Let queued calls finish, then stop the workers."""
+        if self._queue is None:
+            return
+        await asyncio.gather(*self._outstanding, return_exceptions=True)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers, self._queue = [], None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "outstanding": len(self._outstanding),
+            "retries": self.retries,
+        }
+
+    def _start(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.idle()}
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            action = await self._queue.get()
+            await self._execute(action)
+
+    async def _execute(self, action: _Action) -> None:
+        if action.future.done():
+            return
+        if not action.reserved and self._is_message(action.call):
+            action.reserved = True
+            chat_delay = self._chat_bucket(action.chat_id).reserve()
+            if chat_delay:
+                # Park the action instead of sleeping so a busy chat cannot hold every worker.
+                self._requeue_later(chat_delay, action)
+                return
+        global_delay = self.global_bucket.reserve()
+        if global_delay:
+            await asyncio.sleep(global_delay)
+
+        try:
+            with metrics.track("telegram_call", method=getattr(action.call, "__name__", "call")):
+                result = await action.call(*action.args, **action.kwargs)
+        except RetryAfter as e:
+            if action.attempt >= self.max_retries:
+                self._resolve(action, exception=e)
+                return
+            self.retries += 1
+            action.attempt += 1
+            action.reserved = False
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self._requeue_later(retry_after, action)
+        except Exception as e:
+            self._resolve(action, exception=e)
+        else:
+            self._resolve(action, result=result)
+
+    @staticmethod
+    def _is_message(call: Callable[..., Awaitable[Any]]) -> bool:
+        return getattr(call, "__name__", "").startswith(MESSAGE_METHODS)
+
+    def _requeue_later(self, delay: float, action: _Action) -> None:
+        queue = self._queue
+        asyncio.get_running_loop().call_later(delay, queue.put_nowait, action)
+
+    @staticmethod
+    def _resolve(action: _Action, result: Any = None, exception: Exception | None = None) -> None:
+        if action.future.done():
+            return
+        if exception is not None:
+            action.future.set_exception(exception)
+        else:
+            action.future.set_result(result)
@@ -0,0 +1,209 @@
+import json
+import re
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from time import monotonic
+from urllib.parse import urlparse
+
+from services.firebase import FirebaseClient
+
+DEFAULT_LEXICON = {
+    # Matched at the start of a word, so stems also catch inflected forms.
+    "blocked": [
+        "хуй", "хуе", "хуё", "хуя", "пизд", "ебат", "ебан", "ёбан", "ебал", "бляд", "блят",
+        "мудак", "мудил", "пидор", "пидар", "гандон", "шлюх", "уебок", "уёбок", "долбоеб", "долбоёб",
+        "fuck", "motherfuck", "shit", "bitch", "cunt", "nigger", "faggot", "asshole",
+    ],
+    "trivial": [
+        "ok", "ок", "окей", "okay", "ага", "угу", "да", "нет", "ясно", "понял", "поняла", "спасибо", "спс",
+        "благодарю", "привет", "пока", "hi", "hello", "hey", "thanks", "thx", "yes", "no", "lol", "лол",
+        "хорошо", "норм", "круто", "класс", "ахах", "ахаха", "хаха", "+", "+1", "-",
+    ],
+    # Never t.me or telegram.org: invite and channel links are the usual spam payload.
+    "safe_domains": [
+        "youtube.com", "youtu.be", "github.com", "wikipedia.org",
+    ],
+}
+
+URL = re.compile(r"^(?:https?://)?([\w.-]+\.[a-z]{2,})(?:[/?#]\S*)?$", re.IGNORECASE)
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text finds every pattern occurrence."""
+
+    def __init__(self, patterns: list[str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[str]] = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] += self._output[self._fail[nxt]]
+
+    def finditer(self, text: str):
+        """Yield (start, pattern) for every occurrence of every pattern."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                yield i - len(pattern) + 1, pattern
+
+
+class PreFilter:
+    """
+    Local first-stage classifier that runs before the LLM.
+    Returns a confident (status, reason) verdict or None when the message is ambiguous.
+    Outcomes are also counted per chat; chats idle for idle_ttl seconds are forgotten, and past
+    max_chats the least recently active chat goes.
+    """
+
+    def __init__(self, lexicon_path: str | None = None, max_chats: int = 20_000, idle_ttl: float = 3600.0) -> None:
+        """
+        lexicon_path: optional JSON file with "blocked", "trivial" and "safe_domains" lists.
+        max_chats: chats whose outcomes are counted at most.
+        idle_ttl: seconds without messages after which the counters of a chat are dropped.
+        """
+        lexicon = dict(DEFAULT_LEXICON)
+        if lexicon_path:
+            with open(lexicon_path, encoding="utf-8") as f:
+                lexicon |= json.load(f)
+        self.blocked = {self.normalize(word) for word in lexicon["blocked"]}
+        self.trivial = {self.normalize(word) for word in lexicon["trivial"]}
+        self.safe_domains = {domain.lower() for domain in lexicon["safe_domains"]}
+
+        self.chat_blocked: dict[int, set[str]] = {}
+        self.chat_allowed: dict[int, set[str]] = {}
+        self._matcher = AhoCorasick(sorted(self.blocked))
+        self._chat_matchers: dict[int, AhoCorasick] = {}
+
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.counters: Counter = Counter()
+        # Ordered by last activity: idle and least recently active chats are at the front.
+        self.chat_counters: OrderedDict[int, tuple[float, Counter]] = OrderedDict()
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+
+    async def warm(self, firebase_client: FirebaseClient) -> None:
+        """Load per-chat word lists from lexicon/{chat_id}."""
+        data = await firebase_client.read("lexicon") or {}
+        for chat_id, lists in data.items():
+            lists = lists or {}
+            self.chat_blocked[int(chat_id)] = set((lists.get("blocked") or {}).keys())
+            self.chat_allowed[int(chat_id)] = set((lists.get("allowed") or {}).keys())
+
+    def block_word(self, chat_id: int, word: str) -> None:
+        word = self.normalize(word)
+        self.chat_blocked.setdefault(chat_id, set()).add(word)
+        self.chat_allowed.get(chat_id, set()).discard(word)
+        self._chat_matchers.pop(chat_id, None)
+
+    def allow_word(self, chat_id: int, word: str) -> None:
+        word = self.normalize(word)
+        self.chat_allowed.setdefault(chat_id, set()).add(word)
+        self.chat_blocked.get(chat_id, set()).discard(word)
+        self._chat_matchers.pop(chat_id, None)
+
+    def remove_word(self, chat_id: int, word: str) -> None:
+        word = self.normalize(word)
+        self.chat_blocked.get(chat_id, set()).discard(word)
+        self.chat_allowed.get(chat_id, set()).discard(word)
+        self._chat_matchers.pop(chat_id, None)
+
+    def check(self, chat_id: int, message: str) -> tuple[str, str] | None:
+        """Confident verdict for the message or None if it has to go to the LLM."""
+        verdict = self._classify(chat_id, message)
+        outcome = "passed" if verdict is None else verdict[0]
+        self.counters[outcome] += 1
+        now = monotonic()
+        entry = self.chat_counters.pop(chat_id, None)
+        counters = entry[1] if entry is not None else Counter()
+        counters[outcome] += 1
+        self.chat_counters[chat_id] = (now, counters)
+        self._evict(now)
+        return verdict
+
+    @property
+    def llm_calls_saved(self) -> int:
+        return self.counters["safe"] + self.counters["unsafe"]
+
+    def stats(self) -> dict:
+        return {
+            "safe": self.counters["safe"],
+            "unsafe": self.counters["unsafe"],
+            "passed": self.counters["passed"],
+            "llm_calls_saved": self.llm_calls_saved,
+        }
+
+    def _evict(self, now: float) -> None:
+        deadline = now - self.idle_ttl
+        while self.chat_counters:
+            chat_id, (last_seen, _) = next(iter(self.chat_counters.items()))
+            if len(self.chat_counters) <= self.max_chats and last_seen >= deadline:
+                break
+            del self.chat_counters[chat_id]
+            self.evictions += 1
+
+    def _classify(self, chat_id: int, message: str) -> tuple[str, str] | None:
+        text = self.normalize(message).strip()
+
+        # Lexicon entries are word-start stems: a hit counts only at the beginning
+        # of a word that is not on the chat's allow list.
+        allowed = self.chat_allowed.get(chat_id, set())
+        word_starts = {word.start(): word.group() for word in re.finditer(r"\w+", text)}
+        for start, pattern in self._matcher_for(chat_id).finditer(text):
+            word = word_starts.get(start)
+            if word is not None and word not in allowed:
+                return "unsafe", f"Запрещённое слово: {pattern}"
+
+        if not re.search(r"\w", text):
+            return "safe", ""
+        if text.strip(" .,!?)(") in self.trivial or text.isdigit():
+            return "safe", ""
+        url = URL.match(text)
+        if url and self._safe_domain(url.group(1)):
+            return "safe", ""
+        return None
+
+    def _safe_domain(self, host: str) -> bool:
+        host = urlparse(f"//{host}").hostname or host
+        return any(host == domain or host.endswith(f".{domain}") for domain in self.safe_domains)
+
+    def _matcher_for(self, chat_id: int) -> AhoCorasick:
+        extra = self.chat_blocked.get(chat_id)
+        if not extra:
+            return self._matcher
+        matcher = self._chat_matchers.get(chat_id)
+        if matcher is None:
+            matcher = AhoCorasick(sorted(self.blocked | extra))
+            self._chat_matchers[chat_id] = matcher
+        return matcher
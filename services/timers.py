@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from time import time
+from typing import Awaitable, Callable
+
+
+class TimerKind(Enum):
+    STRIKE_DECAY = "STRIKE_DECAY"
+    UNMUTE = "UNMUTE"
+    UNBAN = "UNBAN"
+
+
+TimerHandler = Callable[[int, int], Awaitable[None]]
+
+_DELETE = "DELETE FROM timers WHERE kind = ? AND chat_id = ? AND user_id = ?"
+_DELETE_DUE = _DELETE + " AND due = ?"
+_INSERT = "INSERT INTO timers VALUES (?, ?, ?, ?)"
+
+
+class TimerScheduler:
+    """
+    Persistent one-shot timers keyed by (kind, chat_id, user_id); scheduling a key again replaces its timer.
+    Without a path every timer is kept in an in-memory heap. With a path the SQLite file holds the
+    whole schedule (indexed by due time) and only the timers due within `horizon` seconds are loaded
+    into the heap, so millions of far-off expirations cost disk, not memory, and the schedule is
+    recovered after a restart without reading Firebase. Timers that came due while the bot was down
+    fire right after start; a timer is removed from the file only after its handler has run.
+    The file is only touched by one worker thread, off the event loop: the changes made in one
+    event loop iteration (e.g. a mass mute) are written in one transaction.
+    """
+
+    def __init__(self, path: str | None = None, horizon: float = 3600.0, max_running: int = 64) -> None:
+        """
+        path: optional SQLite file holding the schedule.
+        horizon: seconds ahead of now loaded from the file into memory.
+        max_running: handlers run concurrently at most.
+        """
+        self.horizon = horizon
+        self._handlers: dict[TimerKind, TimerHandler] = {}
+        self._heap: list[tuple[float, str, int, int]] = []
+        self._due: dict[tuple[str, int, int], float] = {}
+        self._loaded_until = float("inf")
+        self._running: set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max_running)
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.fired = 0
+        self.failed = 0
+
+        self._writes: list[tuple[str, tuple]] = []
+        self._flush_scheduled = False
+        self._loading: set[tuple[str, int, int]] | None = None
+        self._stored = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._disk = None
+        if path:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timers")
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS timers "
+                "(kind TEXT, chat_id INTEGER, user_id INTEGER, due REAL, PRIMARY KEY (kind, chat_id, user_id))"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS timers_due ON timers (due)")
+            self._disk.commit()
+            # Counted once; the writes keep it up to date, so stats() never scans the table.
+            self._stored = self._disk.execute("SELECT COUNT(*) FROM timers").fetchone()[0]
+            self._loaded_until = float("-inf")
+
+    def on(self, kind: TimerKind, handler: TimerHandler) -> None:
+        """Run handler(chat_id, user_id) when a timer of this kind comes due."""
+        self._handlers[kind] = handler
+
+    def start(self) -> None:
+        """Load the timers due soon (including the overdue ones) and start firing them."""
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, kind: TimerKind, chat_id: int, user_id: int, due: float) -> None:
+        """due: Unix time. Replaces the pending timer of the same kind, chat and user."""
+        key = (kind.value, chat_id, user_id)
+        if self._disk is not None:
+            self._write_soon((_DELETE, key), (_INSERT, (*key, due)))
+        if due <= self._loaded_until:
+            self._push(key, due)
+        else:
+            # Loaded again when the horizon reaches it; drop the earlier in-memory timer of the key.
+            self._due.pop(key, None)
+
+    def cancel(self, kind: TimerKind, chat_id: int, user_id: int) -> None:
+        key = (kind.value, chat_id, user_id)
+        self._due.pop(key, None)
+        if self._disk is not None:
+            self._write_soon((_DELETE, key))
+
+    async def pending(self, kind: TimerKind, chat_id: int, user_id: int) -> float | None:
+        """Due time of the pending timer of the key, None if there is none."""
+        key = (kind.value, chat_id, user_id)
+        if key in self._due:
+            return self._due[key]
+        if self._disk is not None:
+            self._flush()  # queued before the read, so the read sees them
+            row = await asyncio.get_running_loop().run_in_executor(self._executor, self._read_due, key)
+            return row[0] if row is not None else None
+        return None
+
+    def stats(self) -> dict:
+        stats = {"loaded": len(self._due), "running": len(self._running), "fired": self.fired, "failed": self.failed}
+        if self._disk is not None:
+            stats["stored"] = self._stored
+        return stats
+
+    async def close(self) -> None:
+        """Stop firing timers and wait for the running handlers; pending timers stay in the file."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._disk is not None:
+            self._flush()
+            self._executor.shutdown(wait=True)
+            self._disk.close()
+            self._disk = None
+
+    def _write_soon(self, *changes: tuple[str, tuple]) -> None:
+        """Queue changes of the file; one transaction for all those of the same event loop iteration."""
+        self._writes.extend(changes)
+        if self._loading is not None:
+            # Changed while a load reads the file: its row, if read, is outdated.
+            self._loading.add(changes[0][1][:3])
+        if self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush()
+            return
+        self._flush_scheduled = True
+        loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        if self._disk is None or not self._writes:
+            return
+        changes, self._writes = self._writes, []
+        self._executor.submit(self._write, changes)
+
+    def _write(self, changes: list[tuple[str, tuple]]) -> None:
+        for statement, parameters in changes:
+            rows = self._disk.execute(statement, parameters).rowcount
+            self._stored += rows if statement is _INSERT else -rows
+        self._disk.commit()
+
+    def _read(self, since: float, until: float) -> list[tuple]:
+        return self._disk.execute("SELECT kind, chat_id, user_id, due FROM timers WHERE due > ? AND due <= ?",
+                                  (since, until)).fetchall()
+
+    def _read_due(self, key: tuple[str, int, int]) -> tuple | None:
+        return self._disk.execute("SELECT due FROM timers WHERE kind = ? AND chat_id = ? AND user_id = ?",
+                                  key).fetchone()
+
+    def _push(self, key: tuple[str, int, int], due: float) -> None:
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, *key))
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            # Mostly replaced or cancelled entries: rebuild from the live ones.
+            self._heap = [(due, *key) for key, due in self._due.items()]
+            heapq.heapify(self._heap)
+        if self._heap[0][0] == due:
+            self._wakeup.set()
+
+    async def _load(self, until: float) -> None:
+        """Move the stored timers due up to `until` into the heap."""
+        if self._disk is None or until <= self._loaded_until:
+            return
+        # Timers scheduled during the read go to the heap directly; the keys changed meanwhile are skipped.
+        since, self._loaded_until = self._loaded_until, until
+        self._flush()
+        self._loading = set()
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(self._executor, self._read, since, until)
+        except Exception as e:
+            self._loaded_until = since
+            logging.getLogger(__name__).error(f"Loading timers failed, will retry: {e!r}")
+            return
+        finally:
+            changed, self._loading = self._loading, None
+        for kind, chat_id, user_id, due in rows:
+            if (kind, chat_id, user_id) in changed:
+                continue
+            self._due[(kind, chat_id, user_id)] = due
+            self._heap.append((due, kind, chat_id, user_id))
+        heapq.heapify(self._heap)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            await self._load(time() + self.horizon)
+            now = time()
+            while self._heap and self._heap[0][0] <= now:
+                due, *key = heapq.heappop(self._heap)
+                key = tuple(key)
+                if self._due.get(key) != due:
+                    continue  # replaced or cancelled since it was pushed
+                del self._due[key]
+                await self._slots.acquire()
+                task = asyncio.create_task(self._fire(key, due))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            timeout = self.horizon / 2
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _fire(self, key: tuple[str, int, int], due: float) -> None:
+        kind, chat_id, user_id = key
+        try:
+            handler = self._handlers.get(TimerKind(kind))
+            if handler is not None:
+                await handler(chat_id, user_id)
+            self.fired += 1
+        except Exception as e:
+            self.failed += 1
+            logging.getLogger(__name__).error(f"Timer {kind} for {user_id} in {chat_id} failed: {e!r}")
+        finally:
+            self._slots.release()
+        # Unless the key was scheduled again meanwhile, the stored timer is done.
+        if self._disk is not None:
+            self._write_soon((_DELETE_DUE, (*key, due)))
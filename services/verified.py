@@ -0,0 +1,70 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+from services.firebase import FirebaseClient
+
+
+class VerifiedUsers:
+    """
+    Ids of users who wrote to the bot privately (the keys of users/ in Firebase).
+    Stored as a sorted array of int64 (8 bytes per user) plus a small set of recent
+    additions that is merged into the array once it grows past merge_threshold.
+    """
+
+    def __init__(self, ids: Iterable[int] = (), merge_threshold: int = 4096, authoritative: bool = True) -> None:
+        """
+        merge_threshold: recent additions kept in a set before they are merged into the array.
+        authoritative: every verification goes through this index (a single process). With several
+                       shards a user may verify in another process, so a miss has to be confirmed in Firebase.
+        """
+        self.merge_threshold = merge_threshold
+        self.authoritative = authoritative
+        self._sorted = array("q")
+        self._pending: set[int] = set()
+        self.load(ids)
+
+    def load(self, ids: Iterable[int]) -> None:
+        """Replace the index content."""
+        self._sorted = array("q", sorted(set(ids)))
+        self._pending = set()
+
+    async def warm(self, firebase_client: FirebaseClient) -> None:
+        """Load the ids with one shallow read of users/. Call once at startup."""
+        users = await firebase_client.read("users", shallow=True) or {}
+        self.load(int(user_id) for user_id in users)
+
+    def add(self, user_id: int) -> None:
+        if user_id in self:
+            return
+        self._pending.add(user_id)
+        if len(self._pending) >= self.merge_threshold:
+            self._merge()
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._pending:
+            return True
+        i = bisect_left(self._sorted, user_id)
+        return i < len(self._sorted) and self._sorted[i] == user_id
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the index."""
+        size = self._sorted.buffer_info()[1] * self._sorted.itemsize
+        return size + len(self._pending) * 60  # set slot plus int object
+
+    def _merge(self) -> None:
+        # Copy the array in slices between the insertion points: memcpy speed, no per-element Python loop.
+        merged = array("q")
+        previous = 0
+        for user_id in sorted(self._pending):
+            i = bisect_left(self._sorted, user_id, previous)
+            merged.extend(self._sorted[previous:i])
+            merged.append(user_id)
+            previous = i
+        merged.extend(self._sorted[previous:])
+        self._sorted = merged
+        self._pending = set()
@@ -0,0 +1,96 @@
+"""
+Fake Telegram: posts synthetic updates to the bot's webhook the way Telegram does.
+
+    python -m tools.fake_telegram --url http://127.0.0.1:8080/telegram --secret s3cret --count 100
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import aiohttp
+
+SAMPLE_TEXTS = [
+    "Привет всем!", "ok", "Кто-нибудь знает, когда следующая встреча?", "Спасибо за помощь",
+    "Заработай 5000 рублей в день без вложений, пиши в лс", "https://github.com/python-telegram-bot",
+    "Сегодня отличная погода для прогулки", "👍",
+]
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def group(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"}
+
+
+def message_update(chat_id: int, user_id: int, text: str, reply_to: dict | None = None) -> dict:
+    """
+    Text message in a group, commands (/ban ...) get a bot_command entity.
+    reply_to: message (the "message" of another update) this one replies to.
+    """
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": group(chat_id),
+        "from": user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to is not None:
+        message["reply_to_message"] = reply_to
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def new_members_update(chat_id: int, user_ids: list[int]) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": group(chat_id),
+            "from": user(user_ids[0]),
+            "new_chat_members": [user(user_id) for user_id in user_ids],
+        },
+    }
+
+
+def private_message_update(user_id: int, text: str = "/start") -> dict:
+    update = message_update(user_id, user_id, text)
+    update["message"]["chat"] = {"id": user_id, "type": "private", "first_name": f"User{user_id}"}
+    return update
+
+
+async def post(session: aiohttp.ClientSession, url: str, secret: str, update: dict) -> int:
+    async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+        return response.status
+
+
+async def main(url: str, secret: str, count: int, chats: int, rate: float) -> None:
+    statuses = {}
+    async with aiohttp.ClientSession() as session:
+        for _ in range(count):
+            update = message_update(-1000 - random.randrange(chats), random.randrange(1, 10_000),
+                                    random.choice(SAMPLE_TEXTS))
+            status = await post(session, url, secret, update)
+            statuses[status] = statuses.get(status, 0) + 1
+            if rate:
+                await asyncio.sleep(1 / rate)
+    print(f"posted {count} updates, responses: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=0, help="updates per second, 0 – as fast as possible")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.secret, args.count, args.chats, args.rate))
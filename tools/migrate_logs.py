@@ -0,0 +1,69 @@
+"""
+One-off migration of the moderation log entries written before push ids.
+
+Those entries are stored under uuid4 keys in logs/{chat_id}, which sort after every push id, so
+/modlog showed them as the newest page and could not page past them. Every such entry is re-keyed
+with push_id(its timestamp) and gets the index and rollup entries FirebaseLog writes for new ones;
+the old key is removed in the same multi-path update, so running the migration again is harmless.
+
+    python -m tools.migrate_logs --dry-run
+    python -m tools.migrate_logs --batch 500
+"""
+import argparse
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from services import FirebaseClient, FirebaseBackend
+from services.firebase import PushId, push_id, increment
+
+
+def rekey(chat_id: str, entries: dict) -> dict[str, object]:
+    """Multi-path update moving legacy entries of one chat under push ids, with their indexes and rollups."""
+    updates = {}
+    rollups = Counter()
+    for key, entry in sorted(entries.items(), key=lambda item: item[1].get("timestamp", 0)):
+        timestamp = int(entry.get("timestamp", 0))
+        action, user_id = entry.get("action"), entry.get("user_id")
+        event = push_id(timestamp)
+        updates[f"logs/{chat_id}/{key}"] = None
+        updates[f"logs/{chat_id}/{event}"] = entry
+        if action is not None and user_id is not None:
+            updates[f"logs_by_user/{chat_id}/{user_id}/{event}"] = action
+            updates[f"logs_by_action/{chat_id}/{action}/{event}"] = user_id
+            day = datetime.fromtimestamp(timestamp / 1000, timezone.utc).strftime("%Y-%m-%d")
+            rollups[f"logs_rollup/{chat_id}/{day}/{action}"] += 1
+    return updates | {rollup: increment(count) for rollup, count in rollups.items()}
+
+
+async def main(args: argparse.Namespace) -> None:
+    load_dotenv()
+    client = FirebaseClient(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"),
+                            backend=FirebaseBackend(os.getenv("FIREBASE_BACKEND", FirebaseBackend.EXECUTOR.value).upper()))
+    try:
+        chats = await client.read("logs", shallow=True) or {}
+        moved = 0
+        for chat_id in chats:
+            entries = await client.read(f"logs/{chat_id}") or {}
+            legacy = [(key, entry) for key, entry in entries.items()
+                      if not PushId.is_push_id(key) and isinstance(entry, dict)]
+            for start in range(0, len(legacy), args.batch):
+                updates = rekey(chat_id, dict(legacy[start:start + args.batch]))
+                if not args.dry_run:
+                    await client.update("/", updates)
+            if legacy:
+                print(f"chat={chat_id}  legacy_entries={len(legacy)}{'  (dry run)' if args.dry_run else ''}")
+            moved += len(legacy)
+        print(f"chats={len(chats)}  re-keyed={moved}")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500, help="entries per multi-path update")
+    parser.add_argument("--dry-run", action="store_true", help="only count the entries to re-key")
+    asyncio.run(main(parser.parse_args()))
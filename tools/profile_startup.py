@@ -0,0 +1,74 @@
+"""
+Startup profiler: where the time between `python main.py` and the first update goes.
+
+Runs each phase in a fresh interpreter (so module caches do not hide import cost):
+  * the slowest modules of `import main` by cumulative time (python -X importtime);
+  * `import main` and `build_application()` wall time, with FAST_START=0 and FAST_START=1.
+
+    python -m tools.profile_startup --top 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PHASES = """
+import time, json
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+error = None
+try:
+    main.build_application()
+except Exception as e:
+    error = repr(e)
+built = time.perf_counter()
+print(json.dumps({"import": imported - start, "build": built - imported, "error": error}))
+"""
+
+
+def import_times(top: int) -> list[tuple[float, float, str]]:
+    """(cumulative_s, self_s, module) of the slowest imports of main."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line.removeprefix("import time:").split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:  # the header line
+            continue
+        rows.append((cumulative_us / 1e6, self_us / 1e6, fields[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def phases(fast_start: bool) -> dict:
+    env = dict(os.environ, FAST_START="1" if fast_start else "0")
+    result = subprocess.run([sys.executable, "-c", PHASES], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return {"import": None, "build": None, "error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(top: int) -> None:
+    print(f"slowest imports of main (top {top}, cumulative / self):")
+    for cumulative, own, module in import_times(top):
+        print(f"  {cumulative * 1000:8.1f}ms {own * 1000:8.1f}ms  {module}")
+
+    print("\nstartup phases:")
+    for fast_start in (False, True):
+        result = phases(fast_start)
+        timings = "  ".join(f"{phase}={result[phase] * 1000:7.1f}ms"
+                            for phase in ("import", "build") if result[phase] is not None)
+        print(f"  FAST_START={int(fast_start)}  {timings}")
+        if result["error"]:
+            print(f"    failed: {result['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="number of modules to list")
+    main(parser.parse_args().top)
@@ -0,0 +1,118 @@
+"""
+Train the local classifier (services/classifier.py) on the verdicts already recorded.
+
+Examples come from the moderation log `logs/` (the live Realtime DB, or a JSON export of it):
+the message of a BAN or MUTE is unsafe, the message of a manual UNBAN or UNMUTE (an admin
+reversing a punishment) is safe; the latest action on the same message of the same user wins,
+and entries without a message (expired punishments) are skipped. Verdicts of the LLM kept by a
+persistent verdict cache (VERDICT_CACHE_PATH) add the bulk of the safe examples.
+
+    python -m tools.train_classifier --output classifier.npz                 # logs from Firebase
+    python -m tools.train_classifier --export logs.json --cache verdicts.db --output classifier.npz
+
+A part of the examples (--holdout) is kept out of training to report how the model would decide.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+
+from dotenv import load_dotenv
+
+from services import FirebaseClient, FirebaseBackend, LocalClassifier, VerdictCache
+
+UNSAFE_ACTIONS = {"BAN": 1, "MUTE": 1, "UNBAN": 0, "UNMUTE": 0}
+
+
+async def read_logs() -> dict:
+    """logs/ of the Realtime DB configured in .env, {chat_id: {key: entry}}."""
+    load_dotenv()
+    client = FirebaseClient(firebase_url=os.getenv("FIREBASE_DB_URL"), secret=os.getenv("FIREBASE_DB_SECRET"),
+                            backend=FirebaseBackend(os.getenv("FIREBASE_BACKEND", FirebaseBackend.EXECUTOR.value).upper()))
+    try:
+        chats = await client.read("logs", shallow=True) or {}
+        logs = await client.read_many([f"logs/{chat_id}" for chat_id in chats])
+        return {path.rpartition("/")[2]: entries for path, entries in logs.items() if isinstance(entries, dict)}
+    finally:
+        await client.close()
+
+
+def labelled_logs(logs: dict) -> dict[tuple, tuple[str, int]]:
+    """{(chat, user, normalized message): (message, label)} of the latest action on every message."""
+    examples = {}
+    for chat_id, entries in logs.items():
+        # Oldest first, so later actions overwrite earlier ones. By timestamp, not by key: entries written
+        # before push ids have uuid4 keys, which sort after every push id (tools/migrate_logs.py re-keys them).
+        for entry in sorted(entries.values(), key=lambda entry: entry.get("timestamp", 0)):
+            label = UNSAFE_ACTIONS.get(entry.get("action"))
+            message = entry.get("message") or ""
+            if label is None or not message.strip():
+                continue
+            examples[(chat_id, entry.get("user_id"), VerdictCache.normalize(message))] = (message, label)
+    return examples
+
+
+def cached_verdicts(path: str) -> list[tuple[str, int]]:
+    """(message, label) of the verdicts stored by a VerdictCache with a path (messages stored normalized)."""
+    with sqlite3.connect(path) as db:
+        rows = db.execute("SELECT message, status FROM verdicts WHERE message IS NOT NULL").fetchall()
+    return [(message, int(status.lower().startswith("unsafe"))) for message, status in rows if message.strip()]
+
+
+def report(classifier: LocalClassifier, texts: list[str], labels: list[int]) -> None:
+    if not texts:
+        return
+    probabilities = classifier.probabilities(texts)
+    unsafe = probabilities >= classifier.unsafe_above
+    safe = probabilities < classifier.safe_below
+    decided = unsafe | safe
+    correct = sum(1 for i, label in enumerate(labels) if (unsafe[i] and label) or (safe[i] and not label))
+    flagged_right = sum(1 for i, label in enumerate(labels) if unsafe[i] and label)
+    print(f"holdout={len(texts)}  decided={decided.mean():.1%}  accuracy_decided={correct / max(decided.sum(), 1):.1%}  "
+          f"unsafe_precision={flagged_right / max(unsafe.sum(), 1):.1%}  "
+          f"unsafe_recall={flagged_right / max(sum(labels), 1):.1%}")
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.export:
+        with open(args.export, encoding="utf-8") as f:
+            logs = json.load(f)
+        logs = logs.get("logs", logs)  # an export of the whole database or of logs/ only
+    else:
+        logs = asyncio.run(read_logs())
+    examples = list(labelled_logs(logs).values())
+    from_logs = len(examples)
+    for path in args.cache:
+        examples += cached_verdicts(path)
+    if not examples:
+        raise SystemExit("No labelled messages found")
+    print(f"examples={len(examples)}  from_logs={from_logs}  unsafe={sum(label for _, label in examples)}")
+
+    random.Random(args.seed).shuffle(examples)
+    held = int(len(examples) * args.holdout)
+    train, holdout = examples[held:], examples[:held]
+
+    classifier = LocalClassifier(dim=2 ** args.bits, unsafe_above=args.unsafe_above, safe_below=args.safe_below)
+    losses = classifier.fit([text for text, _ in train], [label for _, label in train], epochs=args.epochs,
+                            learning_rate=args.learning_rate, seed=args.seed)
+    print(f"log_loss first_epoch={losses[0]:.4f}  last_epoch={losses[-1]:.4f}")
+    report(classifier, [text for text, _ in holdout], [label for _, label in holdout])
+    classifier.save(args.output)
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="model file, the LOCAL_CLASSIFIER of the bot")
+    parser.add_argument("--export", help="JSON export of the database or of logs/ instead of reading Firebase")
+    parser.add_argument("--cache", action="append", default=[], help="SQLite file of a persistent verdict cache")
+    parser.add_argument("--bits", type=int, default=18, help="log2 of the hashed feature space")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--learning-rate", type=float, default=2.0)
+    parser.add_argument("--unsafe-above", type=float, default=0.9)
+    parser.add_argument("--safe-below", type=float, default=0.2)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())